@@ -0,0 +1,169 @@
+import argparse # 벤치마크 대상과 config 파일을 받을 수 있도록 해줌
+import json
+import yaml # yaml(설정파일)을 읽고 딕셔너리로 파싱
+
+
+### 코드 실행 명령어
+# python benchmark.py -c configs/mm_story_agent.yaml whisper -a data/이상윤.mp3
+# python benchmark.py -c configs/mm_story_agent.yaml tts --backend dummy --concurrency 1 4 8
+# python benchmark.py -c configs/mm_story_agent.yaml musicgen --device cpu --sizes small medium --precisions fp32 bf16 int8
+# python benchmark.py -c configs/mm_story_agent.yaml audioldm2 --schedulers ddim dpmsolver++ unipc --steps 10 25 50 100
+# python benchmark.py -c configs/mm_story_agent.yaml freesound --fixtures assets/freesound --workers 1 4 8 --latency 0.2
+
+# TTS 벤치마크 기본 문장 (--texts 파일이 없을 때 사용)
+TTS_SAMPLE_TEXTS = [
+    "옛날 옛적 깊은 숲속에 작은 토끼 한 마리가 살고 있었어요.",
+    "토끼는 매일 아침 친구들과 함께 숲속을 뛰어다녔어요.",
+    "어느 날, 토끼는 반짝이는 돌멩이를 발견했어요.",
+    "돌멩이를 들어 올리자 신비한 빛이 숲을 가득 채웠어요.",
+    "친구들은 깜짝 놀라 토끼 곁으로 모여들었어요.",
+    "그날 밤, 숲속 동물들은 별빛 아래에서 함께 노래를 불렀어요.",
+]
+
+
+# Whisper 모델별 real-time factor 측정
+def bench_whisper(config, args):
+    from mm_story_agent.modality_agents.whisper_utils import benchmark_whisper
+
+    whisper_cfg = config.get("whisper", {}).get("cfg", {}).copy()
+    if args.engine:
+        whisper_cfg["engine"] = args.engine
+    if args.assisted:
+        from mm_story_agent.modality_agents.whisper_utils import benchmark_whisper_assisted
+        return benchmark_whisper_assisted(args.audio, whisper_cfg)
+    return benchmark_whisper(args.audio, whisper_cfg, args.models)
+
+
+# TTS 백엔드별 처리량(발화/s)과 real-time factor 측정
+def bench_tts(config, args):
+    from mm_story_agent.modality_agents.speech_agent import benchmark_tts
+    from mm_story_agent.modality_agents.tts_backends import build_tts_backend
+
+    speech_cfg = config.get("speech_generation", {})
+    tts_cfg = speech_cfg.get("cfg", {})
+    backend_name = args.backend or tts_cfg.get("backend", "edge")
+    backend_cfg = tts_cfg.get("backend_cfg", {}) if backend_name == tts_cfg.get("backend", "edge") else {}
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = TTS_SAMPLE_TEXTS
+    return benchmark_tts(build_tts_backend(backend_name, **backend_cfg),
+                         texts,
+                         args.save_dir,
+                         concurrency_levels=args.concurrency,
+                         voice=speech_cfg.get("params", {}).get("voice", "ko-KR-SunHiNeural"),
+                         sample_rate=tts_cfg.get("sample_rate", 16000))
+
+
+# MusicGen 모델 크기 × precision 조합별 오디오초/초 측정
+def bench_musicgen(config, args):
+    from mm_story_agent.modality_agents.music_agent import benchmark_musicgen
+
+    music_cfg = config.get("music_generation", {}).get("cfg", {})
+    device = args.device or music_cfg.get("device", "cuda")
+    configs = [
+        {
+            "model_size": model_size,
+            "precision": precision,
+            "device": device,
+            "num_threads": args.threads or music_cfg.get("num_threads"),
+            "stream_steps": args.stream_steps,
+        }
+        for model_size in args.sizes
+        for precision in args.precisions
+        # int8 dynamic quantization은 CPU 전용
+        if precision != "int8" or device == "cpu"
+    ]
+    return benchmark_musicgen(configs, args.prompt, duration=args.duration)
+
+
+# AudioLDM2 스케줄러 × 단계 수별 클립당 시간과 CLAP 점수 측정
+def bench_audioldm2(config, args):
+    from mm_story_agent.modality_agents.sound_agent import benchmark_audioldm2
+
+    sound_cfg = config.get("sound_generation", {}).get("cfg", {})
+    return benchmark_audioldm2(args.prompts,
+                               args.schedulers,
+                               args.steps,
+                               device=args.device or sound_cfg.get("device", "cuda"))
+
+
+# 로컬 Freesound 대역 서버로 검색/다운로드 동시성과 캐시 효과 측정
+def bench_freesound(config, args):
+    from mm_story_agent.modality_agents.freesound_agent import benchmark_freesound
+
+    if args.queries:
+        queries = args.queries
+    else:
+        # fixture 파일 이름을 검색어로 사용
+        from pathlib import Path
+        queries = [path.stem.replace("_", " ") for path in sorted(Path(args.fixtures).iterdir()) if path.is_file()]
+    return benchmark_freesound(queries,
+                               args.fixtures,
+                               worker_levels=args.workers,
+                               latency=args.latency,
+                               error_rate=args.error_rate,
+                               rate_limit_rate=args.rate_limit_rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", "-c", type=str, required=True, help="YAML 설정 파일 경로")
+    parser.add_argument("--output", "-o", type=str, default=None, help="결과 JSON 저장 경로")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    whisper_parser = subparsers.add_parser("whisper", help="Whisper 음성 인식 RTF 측정")
+    whisper_parser.add_argument("--audio", "-a", type=str, required=True, help="측정용 음성 파일 경로")
+    whisper_parser.add_argument("--engine", type=str, default=None, help="whisper.cfg.engine 덮어쓰기")
+    whisper_parser.add_argument("--models", nargs="+", default=None, help="측정할 모델 목록 (기본: WHISPER_MODELS)")
+    whisper_parser.add_argument("--assisted", action="store_true", help="assisted generation 속도 향상과 acceptance rate 측정")
+    whisper_parser.set_defaults(func=bench_whisper)
+
+    tts_parser = subparsers.add_parser("tts", help="TTS 백엔드 처리량/RTF 측정")
+    tts_parser.add_argument("--backend", type=str, default=None, help="speech_generation.cfg.backend 덮어쓰기")
+    tts_parser.add_argument("--texts", type=str, default=None, help="한 줄에 한 문장씩 적힌 텍스트 파일")
+    tts_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4], help="측정할 동시 작업 수 목록")
+    tts_parser.add_argument("--save_dir", type=str, default="./cache/benchmark/tts", help="합성 음성 저장 경로")
+    tts_parser.set_defaults(func=bench_tts)
+
+    musicgen_parser = subparsers.add_parser("musicgen", help="MusicGen 설정별 오디오초/초 측정")
+    musicgen_parser.add_argument("--device", type=str, default=None, help="music_generation.cfg.device 덮어쓰기")
+    musicgen_parser.add_argument("--sizes", nargs="+", default=["small", "medium"], help="모델 크기 목록")
+    musicgen_parser.add_argument("--precisions", nargs="+", default=["fp32", "bf16", "int8"], help="precision 목록")
+    musicgen_parser.add_argument("--threads", type=int, default=None, help="CPU 연산 스레드 수")
+    musicgen_parser.add_argument("--stream_steps", type=int, default=0, help=">0이면 스트리밍 디코딩으로 측정")
+    musicgen_parser.add_argument("--duration", type=float, default=10.0, help="생성 길이 (초)")
+    musicgen_parser.add_argument("--prompt", type=str, default="gentle acoustic guitar lullaby for a children's story",
+                                 help="측정용 음악 프롬프트")
+    musicgen_parser.set_defaults(func=bench_musicgen)
+
+    audioldm2_parser = subparsers.add_parser("audioldm2", help="AudioLDM2 스케줄러/단계 수별 시간과 품질 비교")
+    audioldm2_parser.add_argument("--device", type=str, default=None, help="sound_generation.cfg.device 덮어쓰기")
+    audioldm2_parser.add_argument("--schedulers", nargs="+", default=["ddim", "dpmsolver++", "unipc"], help="스케줄러 목록")
+    audioldm2_parser.add_argument("--steps", nargs="+", type=int, default=[10, 25, 50, 100], help="단계 수 목록")
+    audioldm2_parser.add_argument("--prompts", nargs="+",
+                                  default=["birds chirping in a forest", "rain falling on a roof"],
+                                  help="측정용 효과음 프롬프트")
+    audioldm2_parser.set_defaults(func=bench_audioldm2)
+
+    freesound_parser = subparsers.add_parser("freesound", help="Freesound 대역 서버로 검색/다운로드 동시성과 캐시 측정")
+    freesound_parser.add_argument("--fixtures", type=str, required=True, help="대역 서버가 제공할 오디오 파일 디렉토리")
+    freesound_parser.add_argument("--queries", nargs="+", default=None, help="검색어 목록 (기본: fixture 파일 이름)")
+    freesound_parser.add_argument("--workers", nargs="+", type=int, default=[1, 8], help="측정할 동시 작업 수 목록")
+    freesound_parser.add_argument("--latency", type=float, default=0.2, help="대역 서버 응답 지연 (초)")
+    freesound_parser.add_argument("--error_rate", type=float, default=0.0, help="503 응답 확률")
+    freesound_parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="429 응답 확률")
+    freesound_parser.set_defaults(func=bench_freesound)
+
+    args = parser.parse_args()
+
+    with open(args.config, encoding='utf-8') as reader:
+        config = yaml.load(reader, Loader=yaml.FullLoader)
+
+    results = args.func(config, args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        print(f"[INFO] 벤치마크 결과가 {args.output}에 저장되었습니다.")
@@ -6,6 +6,7 @@ from networkx import full_rary_tree
 import torch.multiprocessing as mp
 mp.set_start_method("spawn", force=True)
 import ast
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from tqdm import trange
 from .base import init_tool_instance
@@ -26,6 +27,43 @@ class MMStoryAgent:
         self._write_file(story_dir / "full_text_raw.txt", raw_text)
 
         full_text = self._refine_text(config, raw_text, story_dir)
+        self._scene_pipeline(config, full_text, story_dir)
+
+    # 스트리밍 파이프라인: 확정된 전사 구간이 도착하는 대로 정제 단계에 넘김
+    def call_stream(self, config, segments):
+        story_dir = self._get_story_dir(config)
+        stream_cfg = config.get("whisper", {}).get("cfg", {}).get("stream", {})
+        refine_min_chars = stream_cfg.get("refine_min_chars", 400)
+
+        print("[STEP 1] 스트리밍 전사 구간 정제 중...")
+        refine_writer = init_tool_instance(config["refine_writer"])
+        raw_parts, pending, futures = [], [], []
+        # LLM 에이전트가 대화 히스토리를 공유하므로 정제 요청은 한 번에 하나씩 순서대로 처리
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for segment in segments:
+                print(f"[STREAM] {segment['start']:.1f}s ~ {segment['end']:.1f}s: {segment['text']}")
+                raw_parts.append(segment["text"])
+                pending.append(segment["text"])
+                if sum(len(text) for text in pending) >= refine_min_chars:
+                    futures.append(executor.submit(refine_writer.call, {"raw_text": " ".join(pending)}))
+                    pending = []
+            if pending:
+                futures.append(executor.submit(refine_writer.call, {"raw_text": " ".join(pending)}))
+            refined_parts = [future.result() for future in futures]
+
+        raw_text = " ".join(raw_parts).strip()
+        if not raw_text:
+            raise ValueError("[ERROR] 스트리밍 입력에서 전사된 텍스트가 없습니다.")
+        self._write_file(story_dir / "full_text_raw.txt", raw_text)
+
+        refined_text = "\n".join(part.strip() for part in refined_parts if part)
+        self._write_file(story_dir / "refined_text.txt", refined_text)
+
+        full_text = self._post_correct(config, refined_text, story_dir)
+        self._scene_pipeline(config, full_text, story_dir)
+
+    # 장면 추출 → 장면별 요약/메타데이터 생성 및 저장
+    def _scene_pipeline(self, config, full_text: str, story_dir: Path):
         scene_list = self._extract_scenes(config, full_text, story_dir)
         scene_summaries, scene_metadatas = self._generate_summaries_and_metadata(config, scene_list)
 
@@ -60,7 +98,10 @@ class MMStoryAgent:
         refine_writer = init_tool_instance(config["refine_writer"])
         refined_text = refine_writer.call({"raw_text": raw_text})
         self._write_file(story_dir / "refined_text.txt", refined_text)
+        return self._post_correct(config, refined_text, story_dir)
 
+    # 고유명사 오류 수정
+    def _post_correct(self, config, refined_text: str, story_dir: Path) -> str:
         print("[STEP 2] 고유명사 오류 수정(PostCorrectionAgent)...")
         post_corrector = init_tool_instance(config["post_correction"])
         corrected_text = post_corrector.call({"text": refined_text})
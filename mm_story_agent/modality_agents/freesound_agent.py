@@ -1,71 +1,163 @@
-from typing import List
+from typing import List, Optional
+import io
 import os
-import shutil
+import tempfile
+from math import gcd
+from functools import lru_cache
 from pathlib import Path
 import json
-import urllib.parse
-import requests
 
-import librosa
 import numpy as np
 import soundfile as sf
+from scipy.signal import firwin, resample_poly
 from tqdm import tqdm
 
 from ..prompts_en import fsd_search_reviser_system, fsd_search_reviewer_system, fsd_music_reviser_system, fsd_music_reviewer_system
 from ..base import register_tool, init_tool_instance
 from ..utils.llm_output_check import parse_list
+from .freesound_client import FreesoundClient, default_freesound_client
+from .freesound_cache import FreesoundCache
 
 
-def download_file(url, save_path):
+def search_download_sound(query, save_path, max_duration=10.0, client: FreesoundClient = None):
+    client = client or default_freesound_client()
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-
-        with open(save_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
+        client.search_download(query, save_path, max_duration)
     except Exception as e:
         print(f"Error during downloading: {e}")
 
-def search_download_sound(query, save_path, max_duration=10.0):
-    url = f"https://freesound.org/apiv2/search/text/"
-    params = {
-        "query": urllib.parse.quote(query),
-        "token": os.environ["FREESOUND_API_KEY"],
-        "filter": urllib.parse.quote(f"duration:[0 TO {max_duration}]")
-    }
-    response = requests.get(url, params=params)
-    response = response.json()
-    if response["count"] > 0:
-        fsd_id = response["results"][0]["id"]
-        id_url = f"https://freesound.org/apiv2/sounds/{fsd_id}/"
-        response = requests.get(id_url, params={"token": os.environ["FREESOUND_API_KEY"]})
-        sound_detail = response.json()
-        download_file(sound_detail["previews"]["preview-hq-mp3"], save_path)
-
-
-def search_download_mix_query_list(query_list, save_path, sample_rate: int = 16000):
-    save_path = Path(save_path)
-    tmp_path = save_path.parent / save_path.stem
-    tmp_path.mkdir(exist_ok=True, parents=True)
-    for idx, query in enumerate(query_list):
-        search_download_sound(query, tmp_path / f"{idx}.mp3")
-    # resample all x.mp3 to the same sample rate, single channel, and mix them to create a single file
-    # using librosa
-    mixed_audio = None
-    for audio_file in tmp_path.glob("*.mp3"):
-        y, sr = librosa.load(audio_file, sr=sample_rate, mono=True)
-        if mixed_audio is None:
-            mixed_audio = y
-        else:
-            if y.shape[0] > mixed_audio.shape[0]:
-                mixed_audio = np.pad(mixed_audio, (0, y.shape[0] - mixed_audio.shape[0]))
-            elif y.shape[0] < mixed_audio.shape[0]:
-                y = np.pad(y, (0, mixed_audio.shape[0] - y.shape[0]))
-            mixed_audio += y
-    sf.write(save_path.__str__(), mixed_audio, sample_rate)
-    shutil.rmtree(tmp_path)
+
+# 에이전트 설정에서 Freesound 클라이언트 생성 (한 번의 호출 안의 모든 요청이 연결 풀을 공유)
+# cfg.cache.enabled면 SQLite 인덱스 + 미리듣기 저장소를 먼저 조회 (offline: true면 캐시만 사용)
+def build_freesound_client(cfg) -> FreesoundClient:
+    cache_cfg = cfg.get("cache", {})
+    cache = None
+    if cache_cfg.get("enabled", True):
+        cache = FreesoundCache(cache_cfg.get("dir", "./cache/freesound"),
+                               ttl_days=cache_cfg.get("ttl_days", 30.0),
+                               max_bytes=int(cache_cfg.get("max_size_mb", 1024) * 1024 ** 2),
+                               offline=cache_cfg.get("offline", False))
+    return FreesoundClient(
+        api_base=cfg.get("api_base"),
+        max_workers=cfg.get("max_workers", 8),
+        connect_timeout=cfg.get("connect_timeout", 5.0),
+        read_timeout=cfg.get("read_timeout", 30.0),
+        max_retries=cfg.get("max_retries", 3),
+        backoff_factor=cfg.get("backoff_factor", 1.0),
+        cache=cache,
+    )
+
+
+# 인코딩된 미리듣기(mp3) 바이트를 임시 파일 없이 메모리에서 mono float32로 디코딩 (libsndfile 1.1 이상)
+def decode_audio_bytes(data: bytes):
+    try:
+        audio, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return audio.mean(axis=1), sr
+    except RuntimeError:
+        # libsndfile 1.1 미만은 mp3를 읽지 못하므로 임시 파일을 거쳐 librosa(audioread)로 디코딩
+        import librosa
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            audio, sr = librosa.load(tmp_path, sr=None, mono=True)
+        finally:
+            os.remove(tmp_path)
+        return audio.astype(np.float32), sr
+
+
+# 변환 비율별 anti-aliasing FIR 필터 (resample_poly 기본값과 같은 kaiser(5.0) 설계, 한 번만 계산)
+@lru_cache(maxsize=None)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+
+# polyphase 필터로 리샘플링 (같은 비율의 소스는 필터 설계를 공유)
+def resample_audio(audio: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    if orig_sr == target_sr:
+        return audio
+    divisor = gcd(orig_sr, target_sr)
+    up, down = target_sr // divisor, orig_sr // divisor
+    return resample_poly(audio, up, down, window=_polyphase_filter(up, down)).astype(np.float32)
+
+
+# 최대 길이의 출력 버퍼 하나에 소스를 차례로 더함 (소스 수 x 길이 크기의 중간 버퍼를 만들지 않음)
+# 합산 결과의 peak가 peak_limit를 넘으면 전체를 줄여 클리핑을 막음
+def mix_sources(sources: List[np.ndarray], peak_limit: float = 0.98):
+    if len(sources) == 0:
+        return None
+    mixed = np.zeros(max(len(source) for source in sources), dtype=np.float32)
+    for source in sources:
+        mixed[:len(source)] += source
+    peak = np.abs(mixed).max()
+    if peak > peak_limit:
+        mixed *= peak_limit / peak
+    return mixed
+
+
+# 미리듣기 바이트 목록을 디코딩/리샘플링하여 mix한 뒤 save_path에 바로 저장 (내용이 하나도 없으면 저장하지 않음)
+def mix_preview_contents(contents: List[Optional[bytes]], save_path, sample_rate: int = 16000):
+    sources = []
+    for data in contents:
+        if data is None:
+            continue
+        # 디코딩할 수 없는 미리듣기 하나 때문에 페이지 전체가 실패하지 않도록 건너뜀
+        try:
+            audio, sr = decode_audio_bytes(data)
+        except Exception as e:
+            print(f"[WARN] 미리듣기 디코딩 실패, 건너뜀: {e}")
+            continue
+        sources.append(resample_audio(audio, sr, sample_rate))
+    mixed_audio = mix_sources(sources)
+    if mixed_audio is not None:
+        sf.write(str(save_path), mixed_audio, sample_rate)
+
+
+def search_download_mix_query_list(query_list, save_path, sample_rate: int = 16000, client: FreesoundClient = None):
+    client = client or default_freesound_client()
+    contents = client.search_fetch_many([(query, 10.0) for query in query_list])
+    mix_preview_contents(contents, save_path, sample_rate)
+
+
+# Freesound 대역 서버에 대해 동시 작업 수별 검색/다운로드 시간 측정 (캐시 없음 / 빈 캐시(cold) / 채워진 캐시(warm))
+def benchmark_freesound(queries: List[str],
+                        fixture_dir: str,
+                        worker_levels: List[int] = (1, 8),
+                        latency: float = 0.2,
+                        error_rate: float = 0.0,
+                        rate_limit_rate: float = 0.0,
+                        seed: int = 0) -> List[dict]:
+    import tempfile
+    import time
+    from ..utils.freesound_server import FreesoundStubServer
+
+    results = []
+    with FreesoundStubServer(fixture_dir, latency=latency, error_rate=error_rate,
+                             rate_limit_rate=rate_limit_rate, seed=seed) as server:
+        for max_workers in worker_levels:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cache = FreesoundCache(cache_dir)
+                for label, client_cache in (("no_cache", None), ("cold", cache), ("warm", cache)):
+                    client = FreesoundClient(api_key="stub", api_base=server.api_base, max_workers=max_workers,
+                                             backoff_factor=0.1, cache=client_cache)
+                    requests_before = sum(server.requests.values())
+                    start = time.perf_counter()
+                    contents = client.search_fetch_many([(query, 10.0) for query in queries])
+                    elapsed = time.perf_counter() - start
+                    results.append({
+                        "max_workers": max_workers,
+                        "cache": label,
+                        "queries": len(queries),
+                        "found": sum(data is not None for data in contents),
+                        "http_requests": sum(server.requests.values()) - requests_before,
+                        "elapsed": elapsed,
+                    })
+                    print(f"[INFO] workers {max_workers} {label}: {len(queries)}개 검색어 {elapsed:.2f}s "
+                          f"(HTTP 요청 {results[-1]['http_requests']}개)")
+                cache.close()
+    return results
 
 
 @register_tool("freesound_sfx_retrieval")
@@ -123,12 +215,19 @@ class FreesoundSfxAgent:
         queries = self.generate_search_query_from_story(params["pages"])
         save_path = params["save_path"]
         save_path = Path(save_path)
+
+        # 모든 페이지의 검색/다운로드를 한꺼번에 동시 실행한 뒤 페이지별로 메모리에서 mix
+        client = build_freesound_client(self.cfg)
+        contents = client.search_fetch_many([(query, 10.0) for query_list in queries for query in query_list])
+
+        offset = 0
         for idx, query_list in enumerate(tqdm(queries)):
-            search_download_mix_query_list(
-                query_list,
+            mix_preview_contents(
+                contents[offset:offset + len(query_list)],
                 save_path / f"p{idx + 1}.mp3",
                 params.get("sample_rate", 16000)
             )
+            offset += len(query_list)
         return {
             "queries": queries
         }
@@ -185,15 +284,12 @@ class FreesoundMusicAgent:
         query = self.generate_search_query_from_story(params["pages"])
         save_path = params["save_path"]
         save_path = Path(save_path)
-        search_download_sound(
-            query,
-            save_path / "tmp.mp3",
-            max_duration=60.0
-        )
+        data = build_freesound_client(self.cfg).search_fetch(query, max_duration=60.0)
+        if data is None:
+            raise RuntimeError(f"Freesound에서 음악을 찾지 못했습니다: {query}")
         sample_rate = params.get("sample_rate", 16000)
-        y, sr = librosa.load(save_path / "tmp.mp3", sr=sample_rate, mono=True)
-        sf.write(save_path / "music.wav", y, sample_rate)
-        (save_path / "tmp.mp3").unlink()
+        y, sr = decode_audio_bytes(data)
+        sf.write(save_path / "music.wav", resample_audio(y, sr, sample_rate), sample_rate)
         return {
             "music_query": query
         }
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Freesound 응답의 영구 로컬 캐시
+# - SQLite 인덱스: 검색어 → 결과 sound id, sound id → 상세 메타데이터, 미리듣기 URL → 내용 해시
+# - 미리듣기 mp3는 내용 해시(sha256) 기준으로 previews/{sha[:2]}/{sha}.mp3에 한 번만 저장
+# 메타데이터와 미리듣기는 ttl_days가 지나면 다시 받고(만료된 미리듣기 내용은 삭제),
+# 미리듣기 저장소가 max_bytes를 넘으면 오래 안 쓴 것부터 삭제
+# offline 모드에서는 만료된 항목도 그대로 사용하여 네트워크 없이 동작 (air-gapped 노드용 미러)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT NOT NULL,
+    max_duration REAL NOT NULL,
+    sound_id INTEGER,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (query, max_duration)
+);
+CREATE TABLE IF NOT EXISTS sounds (
+    id INTEGER PRIMARY KEY,
+    detail TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS previews (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    fetched_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+"""
+
+
+class FreesoundCache:
+    def __init__(self,
+                 cache_dir: str = "./cache/freesound",
+                 ttl_days: float = 30.0,
+                 max_bytes: int = 1024 ** 3,
+                 offline: bool = False) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.preview_dir = self.cache_dir / "previews"
+        self.preview_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_days * 24 * 3600
+        self.max_bytes = max_bytes
+        self.offline = offline
+        # 여러 다운로드 스레드가 하나의 연결을 공유하므로 lock으로 직렬화 (WAL로 다른 프로세스와 동시 사용)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_dir / "index.sqlite", check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # fetched_at 열이 없던 이전 인덱스는 열을 추가 (기존 미리듣기는 만료된 것으로 취급)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(previews)")]
+        if "fetched_at" not in columns:
+            self._conn.execute("ALTER TABLE previews ADD COLUMN fetched_at REAL NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def _fresh(self, fetched_at: float) -> bool:
+        return self.offline or time.time() - fetched_at < self.ttl
+
+    # 검색어 조회 → (캐시 적중 여부, sound id 또는 결과 없음(None))
+    def get_query(self, query: str, max_duration: float) -> Tuple[bool, Optional[int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sound_id, fetched_at FROM queries WHERE query = ? AND max_duration = ?",
+                (query, max_duration)
+            ).fetchone()
+        if row is None or not self._fresh(row[1]):
+            return False, None
+        return True, row[0]
+
+    def put_query(self, query: str, max_duration: float, sound_id: Optional[int]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (query, max_duration, sound_id, fetched_at) VALUES (?, ?, ?, ?)",
+                (query, max_duration, sound_id, time.time())
+            )
+            self._conn.commit()
+
+    def get_sound(self, sound_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT detail, fetched_at FROM sounds WHERE id = ?", (sound_id,)).fetchone()
+        if row is None or not self._fresh(row[1]):
+            return None
+        return json.loads(row[0])
+
+    def put_sound(self, sound_id: int, detail: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sounds (id, detail, fetched_at) VALUES (?, ?, ?)",
+                (sound_id, json.dumps(detail, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.preview_dir / sha256[:2] / f"{sha256}.mp3"
+
+    # 미리듣기 URL의 내용 (없거나 만료되었으면 None), 사용 시간을 갱신하여 eviction 순서에 반영
+    def get_preview(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, fetched_at FROM previews WHERE url = ?", (url,)).fetchone()
+            if row is None or not self._fresh(row[1]):
+                return None
+            # 같은 스레드 lock 안에서 읽어 evict와 겹치지 않게 하고, 다른 프로세스가 지운 경우는 miss로 처리
+            try:
+                data = self._blob_path(row[0]).read_bytes()
+            except FileNotFoundError:
+                return None
+            self._conn.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+            self._conn.commit()
+        return data
+
+    def put_preview(self, url: str, data: bytes) -> str:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO previews (url, sha256, fetched_at) VALUES (?, ?, ?)",
+                               (url, sha256, time.time()))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                (sha256, len(data), time.time())
+            )
+            self._conn.commit()
+        self.evict()
+        return sha256
+
+    # 만료된 미리듣기 항목과, 어떤 유효한 URL도 가리키지 않는 내용 파일 삭제 (offline 모드에서는 유지)
+    def _purge_expired(self):
+        if self.offline:
+            return
+        self._conn.execute("DELETE FROM previews WHERE fetched_at < ?", (time.time() - self.ttl,))
+        orphans = self._conn.execute(
+            "SELECT sha256 FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM previews)"
+        ).fetchall()
+        for (sha256,) in orphans:
+            path = self._blob_path(sha256)
+            if path.exists():
+                path.unlink()
+            self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        self._conn.commit()
+
+    # 만료된 미리듣기를 정리한 뒤, 저장소가 max_bytes를 넘으면 가장 오래 사용하지 않은 내용부터 삭제
+    def evict(self):
+        with self._lock:
+            self._purge_expired()
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for sha256, size in self._conn.execute("SELECT sha256, size FROM blobs ORDER BY last_access").fetchall():
+                path = self._blob_path(sha256)
+                if path.exists():
+                    path.unlink()
+                self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                self._conn.execute("DELETE FROM previews WHERE sha256 = ?", (sha256,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
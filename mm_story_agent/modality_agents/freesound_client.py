@@ -0,0 +1,160 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .freesound_cache import FreesoundCache
+
+# Freesound API 클라이언트
+# 하나의 Session(연결 풀)을 공유하고, 모든 요청에 timeout을 두며,
+# 429(rate limit)와 5xx는 Retry-After를 따르는 지수 백오프로 재시도합니다.
+# search_download_many는 여러 페이지의 검색 → 상세 → 다운로드를 max_workers개까지 동시에 진행합니다.
+# cache가 주어지면 검색어/상세/미리듣기를 먼저 캐시에서 찾고, offline 캐시면 네트워크를 전혀 사용하지 않습니다.
+
+FREESOUND_API_BASE = "https://freesound.org/apiv2"
+
+
+class FreesoundClient:
+    def __init__(self,
+                 api_key: str = None,
+                 api_base: str = None,
+                 max_workers: int = 8,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 max_retries: int = 3,
+                 backoff_factor: float = 1.0,
+                 cache: FreesoundCache = None) -> None:
+        self.cache = cache
+        self.api_key = api_key or os.environ.get("FREESOUND_API_KEY")
+        self.api_base = (api_base or os.environ.get("FREESOUND_API_BASE", FREESOUND_API_BASE)).rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # 동시 작업 수만큼 같은 호스트 연결을 유지
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _get(self, url: str, params: Dict = None, stream: bool = False) -> requests.Response:
+        if self.cache is not None and self.cache.offline:
+            raise ConnectionError(f"offline 모드에서 캐시에 없는 요청입니다: {url}")
+        params = dict(params or {})
+        if self.api_key:
+            params["token"] = self.api_key
+        response = self.session.get(url, params=params, timeout=self.timeout, stream=stream)
+        response.raise_for_status()
+        return response
+
+    # 텍스트 검색 → 첫 번째 결과의 sound id (없으면 None)
+    def search(self, query: str, max_duration: float = 10.0) -> Optional[int]:
+        if self.cache is not None:
+            hit, sound_id = self.cache.get_query(query, max_duration)
+            if hit:
+                return sound_id
+        response = self._get(f"{self.api_base}/search/text/", {
+            "query": query,
+            "filter": f"duration:[0 TO {max_duration}]",
+        }).json()
+        sound_id = response["results"][0]["id"] if response["count"] > 0 else None
+        # 결과가 없는 검색어도 기록하여 다시 조회하지 않음
+        if self.cache is not None:
+            self.cache.put_query(query, max_duration, sound_id)
+        return sound_id
+
+    def sound_detail(self, sound_id: int) -> Dict:
+        if self.cache is not None:
+            detail = self.cache.get_sound(sound_id)
+            if detail is not None:
+                return detail
+        detail = self._get(f"{self.api_base}/sounds/{sound_id}/").json()
+        if self.cache is not None:
+            self.cache.put_sound(sound_id, detail)
+        return detail
+
+    # 미리듣기 파일 내용 (캐시에 있으면 네트워크 없이 반환)
+    def fetch_preview(self, url: str) -> bytes:
+        if self.cache is not None:
+            data = self.cache.get_preview(url)
+            if data is not None:
+                return data
+        with self._get(url, stream=True) as response:
+            data = b"".join(response.iter_content(chunk_size=65536))
+        if self.cache is not None:
+            self.cache.put_preview(url, data)
+        return data
+
+    def download(self, url: str, save_path) -> None:
+        data = self.fetch_preview(url)
+        with open(save_path, "wb") as file:
+            file.write(data)
+
+    # 검색 결과 첫 번째 소리의 HQ mp3 미리듣기를 save_path에 저장, 결과가 없으면 False
+    def search_download(self, query: str, save_path, max_duration: float = 10.0) -> bool:
+        sound_id = self.search(query, max_duration)
+        if sound_id is None:
+            return False
+        sound_detail = self.sound_detail(sound_id)
+        self.download(sound_detail["previews"]["preview-hq-mp3"], save_path)
+        return True
+
+    # 검색 결과 첫 번째 소리의 HQ mp3 미리듣기 내용 (결과가 없으면 None)
+    def search_fetch(self, query: str, max_duration: float = 10.0) -> Optional[bytes]:
+        sound_id = self.search(query, max_duration)
+        if sound_id is None:
+            return None
+        sound_detail = self.sound_detail(sound_id)
+        return self.fetch_preview(sound_detail["previews"]["preview-hq-mp3"])
+
+    # 여러 (query, max_duration) 작업을 동시에 처리 → 작업별 미리듣기 내용 (결과 없음/실패는 None)
+    # 한 작업의 실패는 경고만 남기고 나머지 작업에 영향을 주지 않음
+    def search_fetch_many(self, jobs: List[Tuple[str, float]]) -> List[Optional[bytes]]:
+        def run(job):
+            query, max_duration = job
+            try:
+                return self.search_fetch(query, max_duration)
+            except Exception as e:
+                print(f"[WARN] Freesound 검색/다운로드 실패 ({query}): {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, jobs))
+
+    # 여러 (query, save_path, max_duration) 작업을 동시에 처리하여 파일로 저장 → 작업별 성공 여부
+    def search_download_many(self, jobs: List[Tuple[str, str, float]]) -> List[bool]:
+        contents = self.search_fetch_many([(query, max_duration) for query, _, max_duration in jobs])
+        for (_, save_path, _), data in zip(jobs, contents):
+            if data is not None:
+                with open(save_path, "wb") as file:
+                    file.write(data)
+        return [data is not None for data in contents]
+
+
+# 프로세스 내에서 공유하는 기본 클라이언트 (연결 풀 재사용)
+# 에이전트 설정의 기본값과 같은 캐시(./cache/freesound)를 먼저 조회
+#   FREESOUND_CACHE_DIR: 캐시 위치 (빈 문자열이면 캐시 사용 안 함), FREESOUND_OFFLINE=1: 캐시만 사용
+_DEFAULT_CLIENT: Optional[FreesoundClient] = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+
+def default_freesound_client() -> FreesoundClient:
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            cache_dir = os.environ.get("FREESOUND_CACHE_DIR", "./cache/freesound")
+            offline = os.environ.get("FREESOUND_OFFLINE", "").lower() in ("1", "true", "yes")
+            cache = FreesoundCache(cache_dir, offline=offline) if cache_dir else None
+            _DEFAULT_CLIENT = FreesoundClient(cache=cache)
+        return _DEFAULT_CLIENT
@@ -1,7 +1,10 @@
 from typing import List, Dict
+from collections import OrderedDict
+from pathlib import Path
 import json
 import os
 import random
+import threading
 
 import numpy as np
 import torch
@@ -21,6 +24,17 @@ def setup_seed(seed):
     torch.backends.cudnn.deterministic = True
 
 
+# (이야기 seed, 페이지 번호 등)에서 파생한 독립 seed
+# 페이지마다 자기 seed만으로 초기 노이즈를 만들므로 앞 페이지 생성 여부와 무관하게 같은 결과
+def derive_seed(*words: int) -> int:
+    return int(np.random.SeedSequence(list(words)).generate_state(1)[0])
+
+
+# 페이지 번호와 겹치지 않는 pass별 seed 구분값 (마스크, attention 경로 선택 난수)
+ID_PASS_STREAM = 2 ** 31
+READ_PASS_STREAM = 2 ** 31 + 1
+
+
 class AttnProcessor(torch.nn.Module):
     r"""
     Processor for implementing scaled dot-product attention (enabled by default if you're using PyTorch 2.0).
@@ -108,28 +122,163 @@ class AttnProcessor(torch.nn.Module):
 
         return hidden_states
 
-def cal_attn_mask_xl(total_length,
-                     id_length,
-                     sa32,
-                     sa64,
-                     height,
-                     width,
-                     device="cuda",
-                     dtype=torch.float16):
-    nums_1024 = (height // 32) * (width // 32)
-    nums_4096 = (height // 16) * (width // 16)
-    bool_matrix1024 = torch.rand((1, total_length * nums_1024),device = device,dtype = dtype) < sa32
-    bool_matrix4096 = torch.rand((1, total_length * nums_4096),device = device,dtype = dtype) < sa64
-    bool_matrix1024 = bool_matrix1024.repeat(total_length,1)
-    bool_matrix4096 = bool_matrix4096.repeat(total_length,1)
-    for i in range(total_length):
-        bool_matrix1024[i:i+1,id_length*nums_1024:] = False
-        bool_matrix4096[i:i+1,id_length*nums_4096:] = False
-        bool_matrix1024[i:i+1,i*nums_1024:(i+1)*nums_1024] = True
-        bool_matrix4096[i:i+1,i*nums_4096:(i+1)*nums_4096] = True
-    mask1024 = bool_matrix1024.unsqueeze(1).repeat(1,nums_1024,1).reshape(-1,total_length * nums_1024)
-    mask4096 = bool_matrix4096.unsqueeze(1).repeat(1,nums_4096,1).reshape(-1,total_length * nums_4096)
-    return mask1024, mask4096
+# consistent self-attention 마스크 (해상도별 [id_length + 1, (id_length + 1) * nums] bool 행렬)
+# 행 i < id_length: ID 이미지 i(write)의 key 마스크, 마지막 행: 일반 페이지(read)의 key 마스크
+# 같은 이미지의 토큰은 모두 같은 마스크 행을 쓰므로 토큰 단위로 펼치지 않고, 페이지 수와 무관하게 (id_length + 1) 이미지 분량만 보관
+# 버퍼는 한 번만 할당하고 확산 step마다 refresh()로 제자리 갱신 (전용 generator로 seed 재현)
+#   mask = (ID 이미지 열의 무작위 선택 | 자기 이미지 블록)
+class ConsistentAttnMask:
+    def __init__(self,
+                 id_length,
+                 sa32,
+                 sa64,
+                 height,
+                 width,
+                 device="cuda",
+                 dtype=torch.float16,
+                 seed=None):
+        self.id_length = id_length
+        self.generator = torch.Generator(device=device)
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        self.levels = {}
+        for nums, ratio in (((height // 32) * (width // 32), sa32), ((height // 16) * (width // 16), sa64)):
+            total = (id_length + 1) * nums
+            block_of_column = torch.arange(total, device=device) // nums
+            self.levels[nums] = {
+                "ratio": ratio,
+                "noise": torch.empty((1, id_length * nums), device=device, dtype=dtype),
+                # 일반 페이지 열은 무작위 선택 대상이 아니므로 항상 False로 남음
+                "shared": torch.zeros((1, total), device=device, dtype=torch.bool),
+                # 자기 이미지 블록 (step마다 바뀌지 않음)
+                "own": block_of_column[None] == torch.arange(id_length + 1, device=device)[:, None],
+                "mask": torch.empty((id_length + 1, total), device=device, dtype=torch.bool),
+            }
+        self.refresh()
+
+    def reseed(self, seed):
+        self.generator.manual_seed(seed)
+        self.refresh()
+
+    # 다음 step의 마스크를 기존 버퍼에 다시 뽑음
+    def refresh(self):
+        for nums, level in self.levels.items():
+            noise = level["noise"]
+            torch.rand(noise.shape, generator=self.generator, out=noise)
+            torch.lt(noise, level["ratio"], out=level["shared"][:, :self.id_length * nums])
+            torch.logical_or(level["shared"], level["own"], out=level["mask"])
+
+    # 토큰 수(해상도)에 해당하는 마스크
+    def __getitem__(self, nums_token):
+        return self.levels[nums_token]["mask"]
+
+
+ID_BANK_STORAGES = ("device", "cpu")
+ID_BANK_COMPRESSIONS = ("none", "fp8", "int8")
+FP8_MAX = 448.0     # float8_e4m3fn 최대값
+
+
+# ID 이미지 pass(write)의 hidden state를 step별로 보관하는 저장소 (processor마다 하나)
+# storage: device(연산 장치에 그대로 보관) | cpu(pinned memory로 내려두고, 읽을 때 다음 step을 별도 stream으로 미리 올림)
+# compression: none | fp8(float8_e4m3fn, 텐서별 scale) | int8(토큰별 absmax scale)
+# max_steps: 앞쪽 max_steps개 step만 보관 (이후 step의 일반 페이지는 ID 이미지를 참조하지 않는 self-attention)
+class IdBank:
+    def __init__(self,
+                 storage: str = "device",
+                 compression: str = "none",
+                 max_steps: int = None,
+                 device="cuda",
+                 dtype=torch.float16):
+        if storage not in ID_BANK_STORAGES:
+            raise ValueError(f"지원하지 않는 id_bank storage입니다: {storage} ({', '.join(ID_BANK_STORAGES)})")
+        if compression not in ID_BANK_COMPRESSIONS:
+            raise ValueError(f"지원하지 않는 id_bank compression입니다: {compression} ({', '.join(ID_BANK_COMPRESSIONS)})")
+        if compression == "fp8" and not hasattr(torch, "float8_e4m3fn"):
+            raise ValueError("fp8 id_bank 압축은 float8을 지원하는 PyTorch(2.1 이상)가 필요합니다.")
+        self.storage = storage
+        self.compression = compression
+        self.max_steps = max_steps
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self._entries = {}
+        self._prefetched = {}
+        use_cuda = self.device.type == "cuda"
+        self._pin = storage == "cpu" and use_cuda
+        self._stream = torch.cuda.Stream(self.device) if self._pin else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._prefetched.clear()
+
+    def stores(self, step: int) -> bool:
+        return self.max_steps is None or step < self.max_steps
+
+    def has(self, step: int) -> bool:
+        return step in self._entries
+
+    def _offload(self, tensor):
+        if self.storage != "cpu":
+            return tensor
+        if not self._pin:
+            return tensor.cpu()
+        # 복사는 현재 stream 순서대로 진행되므로, 같은 step을 다시 읽는 다음 pass 전에 완료됨
+        pinned = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+        pinned.copy_(tensor, non_blocking=True)
+        return pinned
+
+    def _compress(self, tensor):
+        tensor = tensor.detach()
+        if self.compression == "int8":
+            scale = tensor.abs().amax(dim=-1, keepdim=True).float().clamp(min=1e-8) / 127.0
+            data = (tensor.float() / scale).round().clamp(-127, 127).to(torch.int8)
+        elif self.compression == "fp8":
+            scale = tensor.abs().amax().float().clamp(min=1e-8) / FP8_MAX
+            data = (tensor.float() / scale).to(torch.float8_e4m3fn)
+        else:
+            data, scale = tensor, None
+        return self._offload(data), None if scale is None else self._offload(scale)
+
+    def _decompress(self, packed):
+        data, scale = packed
+        data = data.to(self.device, non_blocking=True)
+        if scale is None:
+            return data.to(self.dtype)
+        return (data.float() * scale.to(self.device, non_blocking=True)).to(self.dtype)
+
+    # 저장/복원용 상태 (압축된 그대로 cpu 텐서로)
+    def state_dict(self) -> Dict:
+        return {
+            step: [(data.cpu(), None if scale is None else scale.cpu()) for data, scale in packed]
+            for step, packed in self._entries.items()
+        }
+
+    def load_state_dict(self, state: Dict):
+        self.clear()
+        place = (lambda tensor: tensor.to(self.device)) if self.storage == "device" else self._offload
+        for step, packed in state.items():
+            self._entries[step] = [(place(data), None if scale is None else place(scale)) for data, scale in packed]
+
+    def put(self, step: int, tensors: List[torch.Tensor]):
+        if self.stores(step):
+            self._entries[step] = [self._compress(tensor) for tensor in tensors]
+
+    # step의 hidden state 목록 (연산 장치, dtype으로 복원), cpu 보관이면 다음 step을 미리 올려둠
+    def get(self, step: int) -> List[torch.Tensor]:
+        tensors = self._prefetched.pop(step, None)
+        if tensors is not None:
+            current = torch.cuda.current_stream(self.device)
+            current.wait_stream(self._stream)
+            for tensor in tensors:
+                tensor.record_stream(current)
+        else:
+            tensors = [self._decompress(packed) for packed in self._entries[step]]
+        if self._stream is not None and step + 1 in self._entries and step + 1 not in self._prefetched:
+            with torch.cuda.stream(self._stream):
+                self._prefetched[step + 1] = [self._decompress(packed) for packed in self._entries[step + 1]]
+        return tensors
 
 
 class SpatialAttnProcessor2_0(torch.nn.Module):
@@ -157,6 +306,7 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
                  width=720,
                  sa32=0.5,
                  sa64=0.5,
+                 id_bank=None,
                  ):
         super().__init__()
         if not hasattr(F, "scaled_dot_product_attention"):
@@ -167,7 +317,7 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
         self.cross_attention_dim = cross_attention_dim
         self.total_length = id_length + 1
         self.id_length = id_length
-        self.id_bank = {}
+        self.id_bank = IdBank(device=device, dtype=dtype, **(id_bank or {}))
         self.height = height
         self.width = width
         self.sa32 = sa32
@@ -188,54 +338,44 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
         total_count = self.global_attn_args["total_count"]
         attn_count = self.global_attn_args["attn_count"]
         cur_step = self.global_attn_args["cur_step"]
-        mask1024 = self.global_attn_args["mask1024"]
-        mask4096 = self.global_attn_args["mask4096"]
+        masks = self.global_attn_args["masks"]
 
+        id_states = None
         if self.write:
-            self.id_bank[cur_step] = [hidden_states[:self.id_length], hidden_states[self.id_length:]]
-        else:
-            encoder_hidden_states = torch.cat((self.id_bank[cur_step][0].to(self.device),
-                                               hidden_states[:1],
-                                               self.id_bank[cur_step][1].to(self.device), hidden_states[1:]))
+            self.id_bank.put(cur_step, [hidden_states[:self.id_length], hidden_states[self.id_length:]])
+        elif self.id_bank.has(cur_step):
+            id_states = self.id_bank.get(cur_step)
+        # write도 아니고 보관된 step도 아니면 일반 self-attention
+        consistent = self.write or id_states is not None
         # skip in early step
         if cur_step < 5:
-            hidden_states = self.__call2__(attn, hidden_states, encoder_hidden_states, attention_mask, temb)
+            if id_states is not None:
+                hidden_states = self.__call_read__(attn, hidden_states, id_states, None, temb)
+            else:
+                hidden_states = self.__call2__(attn, hidden_states, encoder_hidden_states, attention_mask, temb)
         else:   # 256 1024 4096
-            random_number = random.random()
+            random_number = self.global_attn_args["rng"].random()
             if cur_step < 20:
                 rand_num = 0.3
             else:
                 rand_num = 0.1
-            if random_number > rand_num:
+            if random_number > rand_num and consistent:
+                nums_token = hidden_states.shape[1]
+                mask = masks[nums_token]
                 if not self.write:
-                    if hidden_states.shape[1] == (self.height // 32) * (self.width // 32):
-                        attention_mask = mask1024[mask1024.shape[0] // self.total_length * self.id_length:]
-                    else:
-                        attention_mask = mask4096[mask4096.shape[0] // self.total_length * self.id_length:]
+                    # 일반 페이지: ID 이미지 + 자기 자신을 key로 하는 마지막 행 (배치의 모든 페이지가 공유)
+                    hidden_states = self.__call_read__(attn, hidden_states, id_states, mask[self.id_length:], temb)
                 else:
-                    if hidden_states.shape[1] == (self.height // 32) * (self.width // 32):
-                        attention_mask = mask1024[:mask1024.shape[0] // self.total_length * self.id_length,
-                                                  :mask1024.shape[0] // self.total_length * self.id_length]
-                    else:
-                        attention_mask = mask4096[:mask4096.shape[0] // self.total_length * self.id_length, 
-                                                  :mask4096.shape[0] // self.total_length * self.id_length]
-                hidden_states = self.__call1__(attn, hidden_states, encoder_hidden_states, attention_mask, temb)
+                    # ID 이미지: ID 이미지들만 key로 하는 앞쪽 행들
+                    attention_mask = mask[:self.id_length, :self.id_length * nums_token]
+                    hidden_states = self.__call1__(attn, hidden_states, encoder_hidden_states, attention_mask, temb)
             else:
                 hidden_states = self.__call2__(attn, hidden_states, None, attention_mask, temb)
         attn_count += 1
         if attn_count == total_count:
             attn_count = 0
             cur_step += 1
-            mask1024, mask4096 = cal_attn_mask_xl(self.total_length,
-                                                  self.id_length,
-                                                  self.sa32,
-                                                  self.sa64,
-                                                  self.height,
-                                                  self.width,
-                                                  device=self.device, 
-                                                  dtype=self.dtype)
-            self.global_attn_args["mask1024"] = mask1024
-            self.global_attn_args["mask4096"] = mask4096
+            masks.refresh()
 
         self.global_attn_args["attn_count"] = attn_count
         self.global_attn_args["cur_step"] = cur_step
@@ -286,9 +426,15 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
 
         key = key.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
         value = value.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
-        hidden_states = F.scaled_dot_product_attention(
-            query, key, value, attn_mask=attention_mask, dropout_p=0.0, is_causal=False
-        )
+        # attention_mask는 query 이미지별 key 마스크 행 [img_nums, S]
+        # 이미지 블록마다 자기 행을 broadcast하여 계산 ((img_nums * nums_token)² 마스크를 만들지 않음)
+        hidden_states = torch.cat([
+            F.scaled_dot_product_attention(
+                query[:, :, i * nums_token:(i + 1) * nums_token], key, value,
+                attn_mask=attention_mask[i:i + 1], dropout_p=0.0, is_causal=False
+            )
+            for i in range(img_nums)
+        ], dim=2)
 
         hidden_states = hidden_states.transpose(1, 2).reshape(total_batch_size, -1, attn.heads * head_dim)
         hidden_states = hidden_states.to(query.dtype)
@@ -309,6 +455,69 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
         # print(hidden_states.shape)
         return hidden_states
     
+    # 일반 페이지 B장(uncond B장 + cond B장)의 consistent self-attention
+    # 각 페이지는 [ID 이미지들, 자기 자신]을 key로 사용하며, ID 이미지의 key/value는 한 번만 계산하여 B장이 공유
+    def __call_read__(
+        self,
+        attn,
+        hidden_states,
+        id_states,
+        attention_mask=None,
+        temb=None,
+    ):
+        residual = hidden_states
+        if attn.spatial_norm is not None:
+            hidden_states = attn.spatial_norm(hidden_states, temb)
+        input_ndim = hidden_states.ndim
+
+        if input_ndim == 4:
+            total_batch_size, channel, height, width = hidden_states.shape
+            hidden_states = hidden_states.view(total_batch_size, channel, height * width).transpose(1, 2)
+        total_batch_size, nums_token, channel = hidden_states.shape
+        readers = total_batch_size // 2
+
+        if attn.group_norm is not None:
+            hidden_states = attn.group_norm(hidden_states.transpose(1, 2)).transpose(1, 2)
+
+        query = attn.to_q(hidden_states)
+
+        # [2(uncond, cond), id_length * nums_token, C]
+        id_hidden_states = torch.stack([states.reshape(-1, channel) for states in id_states])
+
+        def with_id_tokens(id_part, own_part):
+            # uncond/cond별 ID 토큰을 페이지 수만큼 펼쳐 각 페이지 토큰 앞에 붙임 → [2B, (id_length + 1) * nums_token, C]
+            id_part = id_part[:, None].expand(-1, readers, -1, -1).reshape(total_batch_size, -1, id_part.shape[-1])
+            return torch.cat([id_part, own_part], dim=1)
+
+        key = with_id_tokens(attn.to_k(id_hidden_states), attn.to_k(hidden_states))
+        value = with_id_tokens(attn.to_v(id_hidden_states), attn.to_v(hidden_states))
+
+        inner_dim = key.shape[-1]
+        head_dim = inner_dim // attn.heads
+
+        query = query.view(total_batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+        key = key.view(total_batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+        value = value.view(total_batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+        # attention_mask는 모든 페이지/토큰에 broadcast되는 [1, (id_length + 1) * nums_token] 행
+        hidden_states = F.scaled_dot_product_attention(
+            query, key, value, attn_mask=attention_mask, dropout_p=0.0, is_causal=False
+        )
+
+        hidden_states = hidden_states.transpose(1, 2).reshape(total_batch_size, -1, attn.heads * head_dim)
+        hidden_states = hidden_states.to(query.dtype)
+
+        # linear proj
+        hidden_states = attn.to_out[0](hidden_states)
+        # dropout
+        hidden_states = attn.to_out[1](hidden_states)
+
+        if input_ndim == 4:
+            hidden_states = hidden_states.transpose(-1, -2).reshape(total_batch_size, channel, height, width)
+        if attn.residual_connection:
+            hidden_states = hidden_states + residual
+        hidden_states = hidden_states / attn.rescale_output_factor
+        return hidden_states
+
     def __call2__(
         self,
         attn,
@@ -381,6 +590,34 @@ class SpatialAttnProcessor2_0(torch.nn.Module):
 
         return hidden_states
 
+# 텍스트 인코더 출력 LRU 캐시 (프롬프트 → (prompt_embeds, pooled_prompt_embeds))
+# 스타일 템플릿이 적용된 페이지 프롬프트와 긴 negative 프롬프트를 이야기/페이지마다 다시 인코딩하지 않음
+class PromptEmbeddingCache:
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, prompt: str):
+        entry = self._entries.get(prompt)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(prompt)
+        self.hits += 1
+        return entry
+
+    def put(self, prompt: str, entry):
+        self._entries[prompt] = entry
+        self._entries.move_to_end(prompt)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
 # 역할 추출 => 프롬프트 생성 => 스타일 적용 => 이미지 생성 => 저장
 
 class StoryDiffusionSynthesizer:
@@ -497,8 +734,7 @@ class StoryDiffusionSynthesizer:
         unet.set_attn_processor(attn_procs)
 
         # attention mask 초기화
-        mask1024, mask4096 = cal_attn_mask_xl(
-            self.total_length,
+        self.attn_args["masks"] = ConsistentAttnMask(
             self.id_length,
             self.sa32,
             self.sa64,
@@ -508,11 +744,6 @@ class StoryDiffusionSynthesizer:
             dtype=self.dtype
         )
 
-        self.attn_args.update({
-            "mask1024": mask1024,
-            "mask4096": mask4096
-        })
-
         # 파이프라인 및 기본 negative 프롬프트 저장
         self.pipe = pipe
         self.negative_prompt = (
@@ -553,6 +784,7 @@ class StoryDiffusionSynthesizer:
 
         setup_seed(seed)
         generator = torch.Generator(device=self.device).manual_seed(seed)
+        self.attn_args["masks"].reseed(seed)
         torch.cuda.empty_cache()
 
         # 1. ID 프롬프트 → 일관성 유지용 이미지 생성
@@ -605,28 +837,40 @@ class StoryDiffusionSynthesizer:
 
 
     def __init__(self,
-                 num_pages: int,
                  height: int,
                  width: int,
                  model_name: str = "stabilityai/stable-diffusion-xl-base-1.0",
                  id_length: int = 4,
                  num_steps: int = 50,
-                 cache_dir: str = "./model"):
+                 cache_dir: str = "./model",
+                 id_bank: Dict = None,
+                 batch_size: int = 1,
+                 prompt_cache_size: int = 256):
         self.attn_args = {
             "attn_count": 0,
             "cur_step": 0,
             "total_count": 0,
+            "rng": random.Random(),     # step별 consistent attention 사용 여부 선택 (pass마다 다시 seed)
         }
         self.cache_dir = cache_dir
         self.sa32 = 0.5
         self.sa64 = 0.5
+        self.model_name = model_name
         self.id_length = id_length
-        self.total_length = num_pages
         self.height = height
         self.width = width
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.dtype = torch.float16
         self.num_steps = num_steps
+        # id_bank 보관 정책 (storage / compression / max_steps, IdBank 참고)
+        self.id_bank = id_bank or {}
+        # ID 이미지 이후 페이지를 한 번의 pipeline 호출로 함께 생성할 장 수
+        self.batch_size = max(1, batch_size)
+        self.prompt_cache = PromptEmbeddingCache(prompt_cache_size)
+        # 상주 엔진으로 여러 이야기가 공유하므로 attention 상태(step, 마스크, id_bank)를 쓰는 생성은 한 번에 하나씩
+        self._lock = threading.Lock()
+        # 현재 id_bank를 만든 ID pass의 설정 (같으면 ID pass 없이 페이지만 다시 생성)
+        self._id_bank_key = None
         self.styles = {
             '(No style)': (
                 '{prompt}',
@@ -698,6 +942,7 @@ class StoryDiffusionSynthesizer:
                     width=self.width,
                     sa32=self.sa32,
                     sa64=self.sa64,
+                    id_bank=self.id_bank,
                     global_attn_args=self.attn_args
                 )
                 self.attn_args["total_count"] += 1
@@ -707,8 +952,7 @@ class StoryDiffusionSynthesizer:
         print(f"number of the processor : {self.attn_args['total_count']}")
         # unet.set_attn_processor(copy.deepcopy(attn_procs))
         unet.set_attn_processor(attn_procs)
-        mask1024, mask4096 = cal_attn_mask_xl(
-            self.total_length,
+        self.attn_args["masks"] = ConsistentAttnMask(
             self.id_length,
             self.sa32,
             self.sa64,
@@ -718,16 +962,89 @@ class StoryDiffusionSynthesizer:
             dtype=torch.float16,
         )
 
-        self.attn_args.update({
-            "mask1024": mask1024,
-            "mask4096": mask4096
-        })
-
         self.pipe = pipe
         self.negative_prompt = "naked, deformed, bad anatomy, disfigured, poorly drawn face, mutation," \
                                "extra limb, ugly, disgusting, poorly drawn hands, missing limb, floating" \
                                "limbs, disconnected limbs, blurry, watermarks, oversaturated, distorted hands, amputation"
 
+    # 프롬프트 목록의 텍스트 인코더 출력 (캐시에 없는 프롬프트만 한 번에 인코딩) → (prompt_embeds, pooled_prompt_embeds)
+    def encode_prompts(self, prompts: List[str]):
+        encoded = {}
+        missing = []
+        for prompt in dict.fromkeys(prompts):
+            entry = self.prompt_cache.get(prompt)
+            if entry is None:
+                missing.append(prompt)
+            else:
+                encoded[prompt] = entry
+        if missing:
+            with torch.no_grad():
+                prompt_embeds, _, pooled_prompt_embeds, _ = self.pipe.encode_prompt(
+                    prompt=missing,
+                    device=self.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=False
+                )
+            for idx, prompt in enumerate(missing):
+                encoded[prompt] = (prompt_embeds[idx:idx + 1], pooled_prompt_embeds[idx:idx + 1])
+                self.prompt_cache.put(prompt, encoded[prompt])
+        return (torch.cat([encoded[prompt][0] for prompt in prompts]),
+                torch.cat([encoded[prompt][1] for prompt in prompts]))
+
+    # pipeline에 넘길 임베딩 인자 (negative 프롬프트는 한 번 인코딩한 것을 배치 크기만큼 펼침)
+    def embedding_kwargs(self, prompts: List[str], negative_prompt: str) -> Dict:
+        prompt_embeds, pooled_prompt_embeds = self.encode_prompts(prompts)
+        negative_prompt_embeds, negative_pooled_prompt_embeds = self.encode_prompts([negative_prompt])
+        batch_size = len(prompts)
+        return {
+            "prompt_embeds": prompt_embeds,
+            "pooled_prompt_embeds": pooled_prompt_embeds,
+            "negative_prompt_embeds": negative_prompt_embeds.expand(batch_size, -1, -1),
+            "negative_pooled_prompt_embeds": negative_pooled_prompt_embeds.expand(batch_size, -1),
+        }
+
+    # 이전 이야기의 ID hidden state 해제
+    def clear_id_bank(self):
+        for processor in self.pipe.unet.attn_processors.values():
+            if isinstance(processor, SpatialAttnProcessor2_0):
+                processor.id_bank.clear()
+        self._id_bank_key = None
+
+    def _spatial_processors(self) -> Dict[str, "SpatialAttnProcessor2_0"]:
+        return {name: processor for name, processor in self.pipe.unet.attn_processors.items()
+                if isinstance(processor, SpatialAttnProcessor2_0)}
+
+    # ID pass 설정 식별값 (모델, ID 프롬프트, negative, guidance, seed, 해상도/step, id_bank 정책)
+    def _bank_key(self, id_prompts: List[str], negative_prompt: str, guidance_scale: float, seed: int) -> str:
+        return json.dumps({
+            "model_name": self.model_name,
+            "id_prompts": id_prompts,
+            "negative_prompt": negative_prompt,
+            "guidance_scale": guidance_scale,
+            "seed": seed,
+            "size": [self.height, self.width],
+            "num_steps": self.num_steps,
+            "id_bank": self.id_bank,
+        }, sort_keys=True, ensure_ascii=False)
+
+    def save_id_bank(self, path):
+        torch.save({
+            "key": self._id_bank_key,
+            "banks": {name: processor.id_bank.state_dict() for name, processor in self._spatial_processors().items()},
+        }, path)
+
+    # 저장된 id_bank가 key와 같은 ID pass에서 만들어졌으면 복원하고 True
+    def load_id_bank(self, path, key: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        state = torch.load(path, map_location="cpu")
+        if state.get("key") != key:
+            return False
+        for name, processor in self._spatial_processors().items():
+            processor.id_bank.load_state_dict(state["banks"][name])
+        self._id_bank_key = key
+        return True
+
     def set_attn_write(self,
                        value: bool):
         unet = self.pipe.unet
@@ -752,48 +1069,128 @@ class StoryDiffusionSynthesizer:
              start_merge_step = None,
              style_name: str = "Pixar/Disney Character",
              guidance_scale: float = 5.0,
-             seed: int = 2047):
-        assert len(prompts) == self.total_length, "The number of prompts should be equal to the number of pages."
-        setup_seed(seed)
-        generator = torch.Generator(device=self.device).manual_seed(seed)
-        torch.cuda.empty_cache()
-
-        id_prompts = prompts[:self.id_length]
-        real_prompts = prompts[self.id_length:]
-        self.set_attn_write(True)
+             seed: int = 2047,
+             id_bank_path = None,
+             batch_size: int = None):
+        return self.render_pages(prompts, list(range(len(prompts))), input_id_images, start_merge_step,
+                                 style_name, guidance_scale, seed, id_bank_path, batch_size)
+
+    # 이야기 전체 프롬프트 중 pages(0부터 시작하는 페이지 번호)의 이미지만 생성
+    # 페이지 초기 노이즈는 derive_seed(seed, 페이지), 마스크/경로 난수는 배치마다 같은 seed에서 시작하고
+    # 요청한 페이지가 속한 전체 생성 때의 배치(ID 이후 페이지를 batch_size장씩 묶은 것)를 그대로 다시 실행하므로
+    # 한 페이지만 다시 생성해도 전체 생성 때와 같은 이미지 (같은 batch_size일 때)
+    # ID pass는 같은 설정의 id_bank가 메모리나 id_bank_path에 있으면 생략 (ID 페이지를 요청하면 다시 실행)
+    def render_pages(self,
+                     prompts: List[str],
+                     pages: List[int],
+                     input_id_images = None,
+                     start_merge_step = None,
+                     style_name: str = "Pixar/Disney Character",
+                     guidance_scale: float = 5.0,
+                     seed: int = 2047,
+                     id_bank_path = None,
+                     batch_size: int = None):
+        assert len(prompts) >= self.id_length, "The number of prompts should be at least id_length."
+        assert all(0 <= page < len(prompts) for page in pages), "페이지 번호가 프롬프트 범위를 벗어났습니다."
+        with self._lock:
+            setup_seed(seed)
+            torch.cuda.empty_cache()
+            id_prompts, negative_prompt = self.apply_style(style_name, prompts[:self.id_length], self.negative_prompt)
+            key = self._bank_key(id_prompts, negative_prompt, guidance_scale, seed)
+
+            id_images = None
+            bank_ready = self._id_bank_key == key or (
+                id_bank_path is not None and self.load_id_bank(id_bank_path, key))
+            if not bank_ready or any(page < self.id_length for page in pages):
+                id_images = self._run_id_pass(id_prompts, negative_prompt, guidance_scale, seed,
+                                              input_id_images, start_merge_step)
+                self._id_bank_key = key
+                if id_bank_path is not None:
+                    self.save_id_bank(id_bank_path)
+
+            # 상주 엔진을 공유하는 다른 이야기의 설정에 영향받지 않도록 호출별 batch_size 사용
+            batch_size = max(1, batch_size or self.batch_size)
+            # 전체 생성 때와 같은 배치 구성 중 요청한 페이지가 들어 있는 배치만 실행
+            all_read_pages = list(range(self.id_length, len(prompts)))
+            batches = [all_read_pages[start:start + batch_size] for start in range(0, len(all_read_pages), batch_size)]
+            batches = [batch for batch in batches if any(page in pages for page in batch)]
+            read_images = self._run_read_pass(batches, prompts, style_name, negative_prompt, guidance_scale, seed)
+            return [id_images[page] if page < self.id_length else read_images[page] for page in pages]
+
+    def _page_generators(self, seed: int, pages: List[int]) -> List[torch.Generator]:
+        return [torch.Generator(device=self.device).manual_seed(derive_seed(seed, page)) for page in pages]
+
+    # pass 시작: step 초기화, 마스크와 경로 선택 난수를 pass 종류별 seed로 되돌림
+    def _begin_pass(self, write: bool, seed: int):
+        self.set_attn_write(write)
         self.attn_args.update({
             "cur_step": 0,
             "attn_count": 0
         })
-        id_prompts, negative_prompt = self.apply_style(style_name, id_prompts, self.negative_prompt)
-        id_images = self.pipe(
-            id_prompts,
+        pass_seed = derive_seed(seed, ID_PASS_STREAM if write else READ_PASS_STREAM)
+        self.attn_args["masks"].reseed(pass_seed)
+        self.attn_args["rng"].seed(pass_seed)
+
+    def _run_id_pass(self, id_prompts, negative_prompt, guidance_scale, seed, input_id_images=None,
+                     start_merge_step=None):
+        self.clear_id_bank()
+        self._begin_pass(True, seed)
+        return self.pipe(
             input_id_images=input_id_images,
             start_merge_step=start_merge_step,
             num_inference_steps=self.num_steps,
             guidance_scale=guidance_scale,
             height=self.height, 
             width=self.width,
-            negative_prompt=negative_prompt,
-            generator=generator).images
-    
-        self.set_attn_write(False)
-        real_images = []
-        for real_prompt in real_prompts:
-            self.attn_args["cur_step"] = 0
-            real_prompt = self.apply_style_positive(style_name, real_prompt)
-            real_images.append(self.pipe(
-                real_prompt,
+            generator=self._page_generators(seed, list(range(self.id_length))),
+            **self.embedding_kwargs(id_prompts, negative_prompt)).images
+
+    # 페이지 배치별로 생성하여 {페이지: 이미지} 반환 (같은 id_bank를 읽으며, ID 토큰의 key/value는 배치 내에서 공유)
+    def _run_read_pass(self, batches, prompts, style_name, negative_prompt, guidance_scale, seed):
+        images = {}
+        for batch in batches:
+            self._begin_pass(False, seed)
+            batch_prompts = [self.apply_style_positive(style_name, prompts[page]) for page in batch]
+            images.update(zip(batch, self.pipe(
                 num_inference_steps=self.num_steps,
                 guidance_scale=guidance_scale, 
                 height=self.height, 
                 width=self.width,
-                negative_prompt=negative_prompt,
-                generator=generator).images[0]
+                generator=self._page_generators(seed, batch),
+                **self.embedding_kwargs(batch_prompts, negative_prompt)).images
+            ))
+        return images
+
+
+_SYNTHESIZERS: Dict[tuple, StoryDiffusionSynthesizer] = {}
+_SYNTHESIZERS_LOCK = threading.Lock()
+
+
+# 프로세스 내에서 상주하는 SDXL 엔진 (같은 설정이면 모델 로드, processor 구성, FreeU 설정을 다시 하지 않음)
+def get_story_diffusion_synthesizer(height: int,
+                                    width: int,
+                                    model_name: str = "stabilityai/stable-diffusion-xl-base-1.0",
+                                    id_length: int = 4,
+                                    num_steps: int = 50,
+                                    cache_dir: str = "./model",
+                                    id_bank: Dict = None,
+                                    prompt_cache_size: int = 256) -> StoryDiffusionSynthesizer:
+    key = (model_name, height, width, id_length, num_steps, cache_dir,
+           json.dumps(id_bank or {}, sort_keys=True), prompt_cache_size)
+    with _SYNTHESIZERS_LOCK:
+        if key not in _SYNTHESIZERS:
+            _SYNTHESIZERS[key] = StoryDiffusionSynthesizer(
+                height=height,
+                width=width,
+                model_name=model_name,
+                id_length=id_length,
+                num_steps=num_steps,
+                cache_dir=cache_dir,
+                id_bank=id_bank,
+                prompt_cache_size=prompt_cache_size
             )
+        return _SYNTHESIZERS[key]
 
-        images = id_images + real_images             
-        return images
 
 # StoryDiffusionAgent는 이야기(story) 텍스트를 바탕으로 이미지 프롬프트를 생성하고,
 # Stable Diffusion 기반 모델을 통해 이미지를 생성하는 에이전트입니다.
@@ -802,6 +1199,12 @@ class StoryDiffusionAgent:
 
     def __init__(self, cfg) -> None:
         self.cfg = cfg # 설정 저장 
+        id_bank = cfg.get("id_bank") or {}
+        if cfg.get("persist_id_bank", False) and id_bank.get("compression", "none") == "none" \
+                and id_bank.get("max_steps") is None:
+            # 512x1024, 50 step 기준 압축 없이 전체 step을 저장하면 이야기마다 약 11GB
+            print("[WARN] persist_id_bank가 켜져 있지만 id_bank.compression(int8/fp8)이나 max_steps가 설정되지 않아 "
+                  "id_bank.pt가 매우 커질 수 있습니다 (이야기마다 수 GB ~ 10GB 이상).")
         
     def call(self, params: Dict): # 스토리 페이지 및 저장 경로 불러오기
         pages: List = params["pages"]
@@ -814,20 +1217,24 @@ class StoryDiffusionAgent:
                 if role in image_prompt:
                     image_prompt = image_prompt.replace(role, role_desc)
             image_prompts_with_role_desc.append(image_prompt)
-        generation_agent = StoryDiffusionSynthesizer(
-            num_pages=len(pages),
-            height=self.cfg.get("height", 512),
-            width=self.cfg.get("width", 512),
-            model_name=self.cfg.get("model_name", "stabilityai/stable-diffusion-xl-base-1.0"),
-            id_length=self.cfg.get("id_length", 4),
-            num_steps=self.cfg.get("num_steps", 50),
-            cache_dir="./model"
-        )
+        generation_settings = {
+            "prompts": image_prompts_with_role_desc,
+            "style_name": params.get("style_name", "Storybook"),
+            "guidance_scale": params.get("guidance_scale", 5.0),
+            "seed": params.get("seed", 2047),
+            "batch_size": self.cfg.get("batch_size", 1),
+        }
+        # 5. 한 페이지만 다시 생성할 수 있도록 프롬프트와 생성 설정 저장
+        with open(save_path / "image_prompts.json", "w", encoding="utf-8") as f:
+            json.dump(generation_settings, f, indent=4, ensure_ascii=False)
+        generation_agent = self._get_synthesizer()
         images = generation_agent.call(
             image_prompts_with_role_desc,
-            style_name=params.get("style_name", "Storybook"),
-            guidance_scale=params.get("guidance_scale", 5.0),
-            seed=params.get("seed", 2047)
+            style_name=generation_settings["style_name"],
+            guidance_scale=generation_settings["guidance_scale"],
+            seed=generation_settings["seed"],
+            id_bank_path=self._id_bank_path(save_path),
+            batch_size=generation_settings["batch_size"]
         )
         for idx, image in enumerate(images): # 6. 생성된 이미지 파일 저장
             image.save(save_path / f"p{idx + 1}.png")
@@ -835,6 +1242,50 @@ class StoryDiffusionAgent:
             "prompts": image_prompts_with_role_desc,
             "generation_results": images,
         }
+
+    # 저장된 image_prompts.json으로 일부 페이지만 다시 생성하여 덮어씀 (LLM 호출 없음)
+    # 전체 생성 때의 batch_size로 같은 배치를 다시 실행하므로 결과가 처음 생성한 이미지와 같음
+    # params: save_path, page_numbers (1부터 시작하는 페이지 번호 목록)
+    def rerender(self, params: Dict):
+        save_path = Path(params["save_path"])
+        with open(save_path / "image_prompts.json", encoding="utf-8") as f:
+            generation_settings = json.load(f)
+        page_numbers = params["page_numbers"]
+        images = self._get_synthesizer().render_pages(
+            generation_settings["prompts"],
+            [page_number - 1 for page_number in page_numbers],
+            style_name=generation_settings["style_name"],
+            guidance_scale=generation_settings["guidance_scale"],
+            seed=generation_settings["seed"],
+            id_bank_path=self._id_bank_path(save_path),
+            batch_size=generation_settings.get("batch_size", self.cfg.get("batch_size", 1))
+        )
+        for page_number, image in zip(page_numbers, images):
+            image.save(save_path / f"p{page_number}.png")
+        return {
+            "prompts": [generation_settings["prompts"][page_number - 1] for page_number in page_numbers],
+            "generation_results": images,
+        }
+
+    # persist_id_bank이면 ID pass 결과를 이미지 폴더에 저장하여 재생성 시 ID pass를 생략
+    def _id_bank_path(self, save_path):
+        if not self.cfg.get("persist_id_bank", False):
+            return None
+        return Path(save_path) / "id_bank.pt"
+
+    # 상주 SDXL 엔진 (이야기마다 모델을 다시 불러오지 않음)
+    def _get_synthesizer(self) -> StoryDiffusionSynthesizer:
+        return get_story_diffusion_synthesizer(
+            height=self.cfg.get("height", 512),
+            width=self.cfg.get("width", 512),
+            model_name=self.cfg.get("model_name", "stabilityai/stable-diffusion-xl-base-1.0"),
+            id_length=self.cfg.get("id_length", 4),
+            num_steps=self.cfg.get("num_steps", 50),
+            cache_dir="./model",
+            id_bank=self.cfg.get("id_bank"),
+            prompt_cache_size=self.cfg.get("prompt_cache_size", 256)
+        )
+
     # 이야기 텍스트로부터 등장인물 역할과 설명을 추출    
     def extract_role_from_story(
             self,
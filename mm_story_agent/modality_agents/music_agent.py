@@ -1,59 +1,414 @@
 from pathlib import Path
 import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
 from typing import List, Union, Dict
+import numpy as np
+import librosa
 import soundfile as sf
+import torch
 import torchaudio
 from transformers import AutoProcessor, MusicgenForConditionalGeneration
+from transformers.generation.streamers import BaseStreamer
 
 # 음악 생성 관련 시스템 프롬프트 (스토리 → 음악 프롬프트 생성 및 리뷰용)
 from mm_story_agent.prompts_en import story_to_music_reviser_system, story_to_music_reviewer_system
 # 도구 등록과 초기화 유틸리티
 from mm_story_agent.base import register_tool, init_tool_instance
 
+MUSIC_MODES = ("full", "loop", "continue")
+MUSIC_PRECISIONS = ("fp32", "bf16", "int8")
+
+
+# model_name이 없으면 model_size(small | medium | large)로 체크포인트 결정
+def resolve_musicgen_model(model_name: str = None, model_size: str = "medium") -> str:
+    return model_name or f"facebook/musicgen-{model_size}"
+
+
+# 같은 구간 길이의 두 신호를 equal-power(cos/sin) 곡선으로 교차 (앞 신호는 줄고 뒤 신호는 커짐)
+def equal_power_crossfade(fade_out: np.ndarray, fade_in: np.ndarray) -> np.ndarray:
+    t = np.linspace(0.0, np.pi / 2, len(fade_out), dtype=np.float32)
+    return fade_out * np.cos(t) + fade_in * np.sin(t)
+
+
+# 박자에 맞춘 반복 구간 [start, end) 탐색 (샘플 단위)
+# 첫 박에서 시작하여 마디(4박) 단위로 끝나는 가장 긴 구간을 고르며, end 뒤에 crossfade 길이만큼의 여유를 남김
+def find_loop_region(wav: np.ndarray, sample_rate: int, crossfade: float = 1.0, beats_per_bar: int = 4):
+    xf = int(crossfade * sample_rate)
+    _, beats = librosa.beat.beat_track(y=wav, sr=sample_rate, units="samples")
+    if len(beats) > beats_per_bar:
+        start = int(beats[0])
+        for idx in range(len(beats) - 1, 0, -1):
+            end = int(beats[idx])
+            if idx % beats_per_bar == 0 and end + xf <= len(wav) and end - start > xf:
+                return start, end
+    # 박자를 찾지 못하면 클립 전체를 반복 구간으로 사용
+    return 0, len(wav) - xf
+
+
+# 반복 구간을 crossfade로 이어 붙여 duration초 길이로 확장
+# 구간 끝 뒤의 실제 음(end ~ end+xf)과 구간 시작(start ~ start+xf)을 교차하므로 이음새가 자연스럽게 이어짐
+def extend_loop(wav: np.ndarray, sample_rate: int, duration: float, crossfade: float = 1.0) -> np.ndarray:
+    target = int(duration * sample_rate)
+    if len(wav) >= target:
+        return wav[:target]
+    xf = int(crossfade * sample_rate)
+    start, end = find_loop_region(wav, sample_rate, crossfade)
+    if end - start <= xf:
+        return np.resize(wav, target)
+
+    body = end - start
+    num_loops = int(np.ceil(max(target - (end + xf), 0) / body))
+    out = np.empty(end + xf + num_loops * body, dtype=np.float32)
+    out[:end + xf] = wav[:end + xf]
+    cursor = end
+    for _ in range(num_loops):
+        out[cursor:cursor + xf] = equal_power_crossfade(out[cursor:cursor + xf], wav[start:start + xf])
+        out[cursor + xf:cursor + body + xf] = wav[start + xf:end + xf]
+        cursor += body
+    out = out[:target]
+    # 잘린 끝부분이 뚝 끊기지 않도록 fade-out
+    if xf > 0:
+        out[-xf:] *= np.cos(np.linspace(0.0, np.pi / 2, len(out[-xf:]), dtype=np.float32))
+    return out
+
+
 # Hugging Face의 MusicGen을 활용한 실제 음악 생성기 클래스
 class MusicGenSynthesizer:
     def __init__(self,
                  model_name: str = 'facebook/musicgen-medium',  # 기본 모델
                  device: str = 'cuda',                          # 디바이스 설정 (GPU 권장)
-                 sample_rate: int = 16000                       # 출력 오디오 샘플레이트
+                 sample_rate: int = 16000,                      # 출력 오디오 샘플레이트
+                 precision: str = 'fp32',                       # fp32 | bf16 | int8 (int8은 CPU 전용)
+                 num_threads: int = None                        # CPU 연산 스레드 수 (None이면 코어 수)
                  ) -> None:
+        if precision not in MUSIC_PRECISIONS:
+            raise ValueError(f"지원하지 않는 precision입니다: {precision} (가능: {MUSIC_PRECISIONS})")
+        if precision == "int8" and device != "cpu":
+            raise ValueError("int8 dynamic quantization은 device: cpu에서만 사용할 수 있습니다.")
         self.device = device
         self.sample_rate = sample_rate
+        self.precision = precision
+        if device == "cpu":
+            from mm_story_agent.utils.cpu_utils import configure_cpu_threads
+            configure_cpu_threads(num_threads)
 
         # 입력 텍스트를 모델 입력 형식으로 처리하는 프로세서
         self.processor = AutoProcessor.from_pretrained(model_name)
 
         # MusicGen 모델 로드 및 디바이스 이동
         self.model = MusicgenForConditionalGeneration.from_pretrained(model_name).to(device)
+        self.model.eval()
+        if precision == "bf16":
+            self.model = self.model.to(torch.bfloat16)
+        elif precision == "int8":
+            from mm_story_agent.utils.cpu_utils import quantize_linear_int8
+            self.model = quantize_linear_int8(self.model)
+        self.dtype = torch.bfloat16 if precision == "bf16" else torch.float32
 
-    # 텍스트 프롬프트를 받아 음악을 생성하고 .wav 파일로 저장
-    def call(self,
-             prompt: Union[str, List[str]],
-             save_path: Union[str, Path],
-             duration: float = 30.0,  # 생성할 오디오 길이 (초 단위)
-             ):
-        # 텍스트 프롬프트 전처리
+    # 프롬프트 배치를 max(durations)초만큼 생성하여 모델 샘플레이트의 파형 목록 반환
+    # audio_prompts가 주어지면 그 뒤를 이어서 생성 (반환 파형은 audio_prompts 구간을 포함)
+    def _generate(self, prompts: List[str], durations: List[float], audio_prompts: List[np.ndarray] = None):
+        model_rate = self.model.config.audio_encoder.sampling_rate
         inputs = self.processor(
-            text=[prompt],
+            text=prompts,
+            audio=audio_prompts,
+            sampling_rate=model_rate if audio_prompts is not None else None,
             padding=True,
             return_tensors="pt",  # 파이토치 텐서 반환
         ).to(self.device)
+        if "input_values" in inputs:
+            inputs["input_values"] = inputs["input_values"].to(self.dtype)
 
         # 생성할 토큰 수 계산 (초 단위 → 모델 기준 길이로 변환)
-        seq_length = int(51.2 * duration)
+        seq_length = int(51.2 * max(durations))
+        with torch.inference_mode():
+            audio_values = self.model.generate(**inputs, max_new_tokens=seq_length)[:, 0].cpu()
+        return [wav.float().numpy() for wav in audio_values]
 
-        # 오디오 생성 (1개만 생성됨)
-        wav = self.model.generate(**inputs, max_new_tokens=seq_length)[0, 0].cpu()
+    # 첫 클립 이후 마지막 context초를 audio prompt로 주고 window초씩 이어서 생성 (긴 길이에도 변화가 있는 음악)
+    def _continue_batch(self, prompts: List[str], durations: List[float],
+                        seed_duration: float, window: float, context: float, crossfade: float):
+        model_rate = self.model.config.audio_encoder.sampling_rate
+        targets = [int(duration * model_rate) for duration in durations]
+        wavs = [wav[:int(min(seed_duration, duration) * model_rate)]
+                for wav, duration in zip(self._generate(prompts, [min(seed_duration, d) for d in durations]),
+                                         durations)]
+        ctx = int(context * model_rate)
+        xf = int(crossfade * model_rate)
+        while any(len(wav) < target for wav, target in zip(wavs, targets)):
+            active = [idx for idx, (wav, target) in enumerate(zip(wavs, targets)) if len(wav) < target]
+            contexts = [wavs[idx][-ctx:] for idx in active]
+            continued = self._generate([prompts[idx] for idx in active], [window] * len(active), contexts)
+            for idx, context_wav, wav in zip(active, contexts, continued):
+                # 재디코딩된 context 끝부분과 기존 끝부분을 교차하여 경계의 잡음을 줄임
+                overlap = min(xf, len(context_wav))
+                new = wav[len(context_wav) - overlap:len(context_wav) + int(window * model_rate)]
+                head = wavs[idx]
+                joined = equal_power_crossfade(head[len(head) - overlap:], new[:overlap])
+                wavs[idx] = np.concatenate([head[:len(head) - overlap], joined, new[overlap:]])
+        return [wav[:target] for wav, target in zip(wavs, targets)]
 
-        # 생성된 오디오를 지정된 샘플레이트로 리샘플링
+    # 여러 프롬프트를 padding된 배치 하나로 생성 (가장 긴 길이만큼 생성 후 각자 길이로 잘라냄)
+    # mode
+    #   - full     : 요청 길이 전체를 자기회귀로 생성
+    #   - loop     : seed_duration초만 생성하고 박자에 맞춘 반복 구간을 crossfade로 이어 붙여 확장 (생성 비용이 길이와 무관)
+    #   - continue : seed 클립 뒤를 window초씩 이어서 생성
+    # 반환값: 프롬프트별 sample_rate의 mono 파형 (numpy)
+    def generate_batch(self,
+                       prompts: List[str],
+                       durations: List[float],
+                       mode: str = "full",
+                       seed_duration: float = 10.0,
+                       crossfade: float = 1.0,
+                       window: float = 10.0,
+                       context: float = 5.0):
+        if mode not in MUSIC_MODES:
+            raise ValueError(f"지원하지 않는 음악 생성 모드입니다: {mode} (가능: {MUSIC_MODES})")
+        model_rate = self.model.config.audio_encoder.sampling_rate
+
+        if mode == "continue":
+            raw_wavs = self._continue_batch(prompts, durations, seed_duration, window, context, crossfade)
+        else:
+            clip_durations = [min(seed_duration, d) for d in durations] if mode == "loop" else durations
+            raw_wavs = [wav[:int(d * model_rate)]
+                        for wav, d in zip(self._generate(prompts, clip_durations), clip_durations)]
+
+        wavs = []
+        for wav, duration in zip(raw_wavs, durations):
+            # 생성된 오디오를 지정된 샘플레이트로 리샘플링
+            wav = torchaudio.functional.resample(
+                torch.from_numpy(wav), orig_freq=model_rate, new_freq=self.sample_rate).numpy()
+            if mode == "loop":
+                wav = extend_loop(wav, self.sample_rate, duration, crossfade)
+            wavs.append(wav)
+        return wavs
+
+    # 토큰이 생성되는 대로 play_steps마다 디코딩하여 save_path에 모델 샘플레이트로 기록하고,
+    # 생성이 끝나면 sample_rate로 리샘플링하여 다시 저장 (단일 프롬프트, full 모드)
+    def stream_to_file(self, prompt: str, save_path: Union[str, Path], duration: float = 30.0, play_steps: int = 50):
+        model_rate = self.model.config.audio_encoder.sampling_rate
+        inputs = self.processor(text=[prompt], padding=True, return_tensors="pt").to(self.device)
+        with sf.SoundFile(save_path, "w", samplerate=model_rate, channels=1, subtype="FLOAT") as writer:
+            streamer = MusicgenStreamer(self.model, on_audio=writer.write, play_steps=play_steps)
+            with torch.inference_mode():
+                self.model.generate(**inputs, max_new_tokens=int(51.2 * duration), streamer=streamer)
+        wav, _ = sf.read(save_path, dtype="float32")
         wav = torchaudio.functional.resample(
-            wav,
-            orig_freq=self.model.config.audio_encoder.sampling_rate,
-            new_freq=self.sample_rate
-        )
+            torch.from_numpy(wav[:int(duration * model_rate)]), orig_freq=model_rate, new_freq=self.sample_rate)
+        sf.write(save_path, wav.numpy(), self.sample_rate)
+
+    # 텍스트 프롬프트를 받아 음악을 생성하고 .wav 파일로 저장
+    def call(self,
+             prompt: Union[str, List[str]],
+             save_path: Union[str, Path],
+             duration: float = 30.0,  # 생성할 오디오 길이 (초 단위)
+             **options,               # generate_batch의 mode, seed_duration, crossfade, window, context
+             ):
+        wav = self.generate_batch([prompt], [duration], **options)[0]
 
         # .wav 파일로 저장
-        sf.write(save_path, wav.numpy(), self.sample_rate)
+        sf.write(save_path, wav, self.sample_rate)
+
+
+# MusicGen 생성 중 토큰을 모아 play_steps마다 EnCodec으로 디코딩하고, 새로 확정된 구간을 on_audio로 넘기는 streamer
+# 디코딩은 누적 토큰 전체를 다시 하며, 아직 뒤 토큰의 영향을 받는 끝부분(stride)은 다음 디코딩까지 보류
+class MusicgenStreamer(BaseStreamer):
+    def __init__(self, model, on_audio, play_steps: int = 50, stride: int = None) -> None:
+        self.decoder = model.decoder
+        self.audio_encoder = model.audio_encoder
+        self.generation_config = model.generation_config
+        self.on_audio = on_audio
+        self.play_steps = play_steps
+        if stride is None:
+            hop_length = int(np.prod(self.audio_encoder.config.upsampling_ratios))
+            stride = hop_length * max(play_steps - self.decoder.num_codebooks, 1) // 6
+        self.stride = stride
+        self.token_cache = None
+        self.to_yield = 0
+
+    # delay pattern을 되돌린 코드북 토큰을 파형으로 디코딩
+    def _decode(self, input_ids):
+        _, delay_pattern_mask = self.decoder.build_delay_pattern_mask(
+            input_ids[:, :1],
+            pad_token_id=self.generation_config.decoder_start_token_id,
+            max_length=input_ids.shape[-1],
+        )
+        input_ids = self.decoder.apply_delay_pattern_mask(input_ids, delay_pattern_mask)
+        input_ids = input_ids[input_ids != self.generation_config.pad_token_id].reshape(
+            1, self.decoder.num_codebooks, -1
+        )[None, ...].to(self.audio_encoder.device)
+        audio_values = self.audio_encoder.decode(input_ids, audio_scales=[None]).audio_values[0, 0]
+        return audio_values.float().cpu().numpy()
+
+    def put(self, value):
+        if value.shape[0] // self.decoder.num_codebooks > 1:
+            raise ValueError("MusicgenStreamer는 배치 크기 1만 지원합니다.")
+        if self.token_cache is None:
+            self.token_cache = value
+        else:
+            self.token_cache = torch.cat([self.token_cache, value[:, None]], dim=-1)
+        if self.token_cache.shape[-1] % self.play_steps == 0:
+            audio_values = self._decode(self.token_cache)
+            if len(audio_values) - self.stride > self.to_yield:
+                self.on_audio(audio_values[self.to_yield:len(audio_values) - self.stride])
+                self.to_yield = len(audio_values) - self.stride
+
+    def end(self):
+        if self.token_cache is not None:
+            audio_values = self._decode(self.token_cache)
+            self.on_audio(audio_values[self.to_yield:])
+
+
+# 모델을 상주시킨 채 여러 스토리의 요청을 큐로 받아 배치 단위로 생성하는 엔진
+# 첫 요청 이후 batch_timeout초 동안 들어온 요청을 최대 max_batch_size개까지 묶어 한 번에 생성
+class MusicGenEngine:
+    def __init__(self,
+                 model_name: str = 'facebook/musicgen-medium',
+                 device: str = 'cuda',
+                 sample_rate: int = 16000,
+                 max_batch_size: int = 4,
+                 batch_timeout: float = 0.5,
+                 precision: str = 'fp32',
+                 num_threads: int = None) -> None:
+        self.synthesizer = MusicGenSynthesizer(model_name=model_name, device=device, sample_rate=sample_rate,
+                                               precision=precision, num_threads=num_threads)
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    # 생성 요청 등록 → 완료 시 save_path 경로를 결과로 갖는 Future 반환
+    # options: generate_batch의 mode, seed_duration, crossfade, window, context (같은 options끼리 배치로 묶임)
+    #          stream_steps > 0이면 full 모드 요청을 하나씩 스트리밍 디코딩으로 저장
+    def submit(self, prompt: str, save_path: Union[str, Path], duration: float = 30.0, **options) -> Future:
+        future = Future()
+        self._queue.put(({"prompt": prompt, "save_path": save_path, "duration": duration, "options": options}, future))
+        return future
+
+    # 큐에서 첫 요청을 기다린 뒤 batch_timeout 동안 추가 요청을 모음 (None은 종료 신호)
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_timeout
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # 생성 옵션이 같은 요청끼리 묶어서 생성
+            groups = {}
+            for request, future in batch:
+                groups.setdefault(tuple(sorted(request["options"].items())), []).append((request, future))
+            for group in groups.values():
+                self._generate_group(group)
+
+    def _generate_group(self, group):
+        requests = [request for request, _ in group]
+        options = dict(requests[0]["options"])
+        stream_steps = options.pop("stream_steps", 0)
+        try:
+            if stream_steps and options.get("mode", "full") == "full":
+                for request, future in group:
+                    self.synthesizer.stream_to_file(request["prompt"], request["save_path"],
+                                                    request["duration"], play_steps=stream_steps)
+                    future.set_result(request["save_path"])
+                return
+            wavs = self.synthesizer.generate_batch([request["prompt"] for request in requests],
+                                                   [request["duration"] for request in requests],
+                                                   **options)
+            for (request, future), wav in zip(group, wavs):
+                sf.write(request["save_path"], wav, self.synthesizer.sample_rate)
+                future.set_result(request["save_path"])
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+
+    # 남은 요청을 모두 처리한 뒤 워커 종료
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+
+# 프로세스 내에서 설정별로 하나만 생성하여 재사용되는 MusicGen 엔진
+_ENGINES: Dict[tuple, MusicGenEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_musicgen_engine(model_name: str = 'facebook/musicgen-medium',
+                        device: str = 'cuda',
+                        sample_rate: int = 16000,
+                        max_batch_size: int = 4,
+                        batch_timeout: float = 0.5,
+                        precision: str = 'fp32',
+                        num_threads: int = None) -> MusicGenEngine:
+    key = (model_name, device, sample_rate, precision)
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = MusicGenEngine(model_name, device, sample_rate, max_batch_size, batch_timeout,
+                                           precision=precision, num_threads=num_threads)
+        return _ENGINES[key]
+
+
+# 설정 조합별 MusicGen 생성 속도 측정 (오디오 초 / wall 초, 1보다 크면 실시간보다 빠름)
+# configs: [{"model_size", "precision", "device", "num_threads", "stream_steps"}]
+def benchmark_musicgen(configs: List[Dict], prompt: str, duration: float = 10.0,
+                       save_dir: Union[str, Path] = "./cache/benchmark/musicgen") -> List[Dict]:
+    save_dir = Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for cfg in configs:
+        model_name = resolve_musicgen_model(cfg.get("model_name"), cfg.get("model_size", "medium"))
+        start = time.perf_counter()
+        synthesizer = MusicGenSynthesizer(model_name=model_name,
+                                          device=cfg.get("device", "cpu"),
+                                          precision=cfg.get("precision", "fp32"),
+                                          num_threads=cfg.get("num_threads"))
+        load_time = time.perf_counter() - start
+
+        stream_steps = cfg.get("stream_steps", 0)
+        save_path = save_dir / f"{Path(model_name).name}_{synthesizer.precision}{'_stream' if stream_steps else ''}.wav"
+        start = time.perf_counter()
+        if stream_steps:
+            synthesizer.stream_to_file(prompt, save_path, duration, play_steps=stream_steps)
+        else:
+            synthesizer.call(prompt, save_path, duration)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "model": model_name,
+            "device": synthesizer.device,
+            "precision": synthesizer.precision,
+            "num_threads": torch.get_num_threads() if synthesizer.device == "cpu" else None,
+            "stream_steps": stream_steps,
+            "duration": duration,
+            "load_time": load_time,
+            "elapsed": elapsed,
+            "audio_seconds_per_second": duration / elapsed,
+        })
+        print(f"[INFO] {model_name} {synthesizer.precision}{' (stream)' if stream_steps else ''}: "
+              f"{duration:.1f}s 오디오 {elapsed:.1f}s 소요 ({duration / elapsed:.3f} 오디오초/초), 로드 {load_time:.1f}s")
+        del synthesizer
+    return results
 
 
 # 음악 에이전트 등록: "musicgen_t2m"이라는 이름으로 외부에서 호출 가능
@@ -118,21 +473,55 @@ class MusicGenAgent:
         # 1. 이야기로부터 음악 프롬프트 생성
         music_prompt = self.generate_music_prompt_from_story(pages)
 
-        # 2. MusicGen 기반 음악 생성기 초기화
-        generation_agent = MusicGenSynthesizer(
-            model_name=self.cfg.get("model_name", "facebook/musicgen-medium"),
-            device=self.cfg.get("device", "cuda"),
-            sample_rate=self.cfg.get("sample_rate", 16000),
-        )
-
-        # 3. 생성된 프롬프트를 이용해 음악 생성 및 저장
-        generation_agent.call(
+        # 2. 상주 MusicGen 엔진에 생성 요청 후 music.wav 저장까지 대기
+        self._get_engine().submit(
             prompt=music_prompt,
             save_path=save_path / "music.wav",  # music.wav로 저장
             duration=params.get("duration", 30.0),  # 생성 길이
-        )
+            **self._generation_options(params),
+        ).result()
 
         # 생성된 프롬프트를 반환 (결과 확인용)
         return {
             "prompt": music_prompt,
-        }
\ No newline at end of file
+        }
+
+    # 여러 스토리의 음악을 한 번에 생성: 프롬프트를 모두 만든 뒤 엔진 큐에 넣어 배치로 생성
+    # params_list: 스토리별 call()과 같은 형식의 파라미터 목록
+    def call_many(self, params_list: List[Dict]):
+        engine = self._get_engine()
+        prompts = [self.generate_music_prompt_from_story(params["pages"]) for params in params_list]
+        futures = [
+            engine.submit(
+                prompt=music_prompt,
+                save_path=Path(params["save_path"]) / "music.wav",
+                duration=params.get("duration", 30.0),
+                **self._generation_options(params),
+            )
+            for music_prompt, params in zip(prompts, params_list)
+        ]
+        for future in futures:
+            future.result()
+        return [{"prompt": music_prompt} for music_prompt in prompts]
+
+    # 생성 모드 관련 파라미터 (full | loop | continue)
+    def _generation_options(self, params: Dict) -> Dict:
+        return {
+            "mode": params.get("mode", "full"),
+            "seed_duration": params.get("seed_duration", 10.0),
+            "crossfade": params.get("crossfade", 1.0),
+            "window": params.get("window", 10.0),
+            "context": params.get("context", 5.0),
+            "stream_steps": self.cfg.get("stream_steps", 0),
+        }
+
+    def _get_engine(self) -> MusicGenEngine:
+        return get_musicgen_engine(
+            model_name=resolve_musicgen_model(self.cfg.get("model_name"), self.cfg.get("model_size", "medium")),
+            device=self.cfg.get("device", "cuda"),
+            sample_rate=self.cfg.get("sample_rate", 16000),
+            max_batch_size=self.cfg.get("max_batch_size", 4),
+            batch_timeout=self.cfg.get("batch_timeout", 0.5),
+            precision=self.cfg.get("precision", "fp32"),
+            num_threads=self.cfg.get("num_threads"),
+        )
@@ -5,18 +5,39 @@ import json
 
 # 오디오 저장 및 모델 로딩을 위한 라이브러리
 import torch
+import numpy as np
+import librosa
 import soundfile as sf
-from diffusers import AudioLDM2Pipeline
+import time
+from diffusers import AudioLDM2Pipeline, DDIMScheduler, DPMSolverMultistepScheduler, UniPCMultistepScheduler
 
 # 프롬프트와 도구 등록 유틸
 from mm_story_agent.prompts_en import story_to_sound_reviser_system, story_to_sound_review_system
 from mm_story_agent.base import register_tool, init_tool_instance
+from mm_story_agent.modality_agents.sound_library import SoundLibrary, ClapTextEmbedder
+
+# 디퓨전 스케줄러 (이름 → 클래스, 추가 설정)
+# multistep 계열(DPM-Solver++, UniPC)은 DDIM보다 훨씬 적은 단계로 비슷한 품질에 수렴
+SOUND_SCHEDULERS = {
+    "ddim": (DDIMScheduler, {}),
+    "dpmsolver++": (DPMSolverMultistepScheduler, {"algorithm_type": "dpmsolver++", "solver_order": 2}),
+    "unipc": (UniPCMultistepScheduler, {}),
+}
+
+# 실행별로 고르는 스케줄러/단계 수 프리셋
+SOUND_PRESETS = {
+    "draft": {"scheduler": "unipc", "steps": 10},
+    "standard": {"scheduler": "dpmsolver++", "steps": 25},
+    "final": {"scheduler": "dpmsolver++", "steps": 50},
+}
+
 
 # 오디오 생성기를 구현 클래스
 class AudioLDM2Synthesizer:
 
     def __init__(self,
-                 device: str = 'cuda'  # GPU 사용 권장
+                 device: str = 'cuda',      # GPU 사용 권장
+                 scheduler: str = 'ddim'    # SOUND_SCHEDULERS 중 하나
                  ) -> None:
         self.device = device
         # Hugging Face의 AudioLDM2 모델 불러오기
@@ -24,31 +45,127 @@ class AudioLDM2Synthesizer:
             "cvssp/audioldm2",
             torch_dtype=torch.float16  # FP16로 속도/메모리 최적화
         ).to(self.device)
+        self._scheduler_config = self.pipe.scheduler.config
+        self.set_scheduler(scheduler)
+
+    # 파이프라인의 스케줄러 교체 (모델 가중치는 그대로 사용)
+    def set_scheduler(self, name: str):
+        if name not in SOUND_SCHEDULERS:
+            raise ValueError(f"지원하지 않는 스케줄러입니다: {name} (가능: {list(SOUND_SCHEDULERS)})")
+        scheduler_cls, kwargs = SOUND_SCHEDULERS[name]
+        self.pipe.scheduler = scheduler_cls.from_config(self._scheduler_config, **kwargs)
+        self.scheduler_name = name
+
+    # 프롬프트별 후보 오디오를 CLAP(text-audio) 유사도로 채점 → [프롬프트 수, 후보 수]
+    @torch.no_grad()
+    def score_candidates(self, prompts: List[str], audios: np.ndarray, n_candidate_per_text: int) -> np.ndarray:
+        feature_rate = self.pipe.feature_extractor.sampling_rate
+        audios = librosa.resample(audios, orig_sr=self.pipe.vocoder.config.sampling_rate, target_sr=feature_rate)
+        scores = []
+        for idx, prompt in enumerate(prompts):
+            candidates = audios[idx * n_candidate_per_text:(idx + 1) * n_candidate_per_text]
+            inputs = self.pipe.tokenizer([prompt], return_tensors="pt", padding=True)
+            inputs["input_features"] = self.pipe.feature_extractor(
+                list(candidates), return_tensors="pt", sampling_rate=feature_rate
+            ).input_features.to(self.pipe.text_encoder.dtype)
+            logits_per_text = self.pipe.text_encoder(**inputs.to(self.device)).logits_per_text
+            scores.append(logits_per_text[0].float().cpu().numpy())
+        return np.stack(scores)
 
     # 효과음 생성 함수
+    # 프롬프트를 max_waveforms_per_batch(후보 포함 파형 수) 단위의 micro-batch로 나누어 생성하고
+    # 배치마다 바로 save_paths에 저장하므로 페이지 수와 관계없이 최대 메모리가 일정함
+    # n_candidate_per_text > 1이면 후보를 CLAP 유사도로 채점하여 가장 높은 후보를 저장
+    # 반환값: 프롬프트별 선택된 후보의 점수 (후보가 1개면 None)
     def call(self,
              prompts: List[str],              # 오디오 생성에 사용할 텍스트 목록
-             n_candidate_per_text: int = 3,   # 프롬프트당 생성할 오디오 수
+             save_paths: List[Path],          # 프롬프트별 저장 경로
+             sample_rate: int = 16000,        # 저장 샘플레이트
+             n_candidate_per_text: int = 1,   # 프롬프트당 생성할 오디오 수
              seed: int = 0,                   # 랜덤 시드 고정
              guidance_scale: float = 3.5,     # 텍스트 조건 반영 강도
-             ddim_steps: int = 100            # 디퓨전 단계 수
+             ddim_steps: int = 100,           # 디퓨전 단계 수
+             max_waveforms_per_batch: int = 4  # 한 번의 파이프라인 호출에서 만들 최대 파형 수
              ):
-        # 시드 고정용 생성기
-        generator = torch.Generator(device=self.device).manual_seed(seed)
-
-        # 오디오 생성
-        audios = self.pipe(
-            prompts=prompts,
-            num_inference_steps=ddim_steps,
-            audio_length_in_s=10.0,
-            guidance_scale=guidance_scale,
-            generator=generator,
-            num_waveforms_per_prompt=n_candidate_per_text
-        ).audios
-
-        # 각 프롬프트당 첫 번째 오디오만 선택
-        audios = audios[::n_candidate_per_text]
-        return audios
+        prompts_per_batch = max(1, max_waveforms_per_batch // n_candidate_per_text)
+        scores = []
+        for batch_start in range(0, len(prompts), prompts_per_batch):
+            batch_prompts = prompts[batch_start:batch_start + prompts_per_batch]
+            # 후보마다 프롬프트를 반복하고 (프롬프트 순번, 후보 순번)으로 시드를 고정하여 배치 크기와 무관하게 재현 가능
+            expanded_prompts = [prompt for prompt in batch_prompts for _ in range(n_candidate_per_text)]
+            generators = [
+                torch.Generator(device=self.device).manual_seed(
+                    seed + (batch_start + idx) * n_candidate_per_text + candidate)
+                for idx in range(len(batch_prompts))
+                for candidate in range(n_candidate_per_text)
+            ]
+
+            # 오디오 생성 (후보 채점은 파이프라인 내부가 아닌 score_candidates에서 수행)
+            audios = self.pipe(
+                prompt=expanded_prompts,
+                num_inference_steps=ddim_steps,
+                audio_length_in_s=10.0,
+                guidance_scale=guidance_scale,
+                generator=generators,
+                num_waveforms_per_prompt=1
+            ).audios
+
+            if n_candidate_per_text > 1:
+                batch_scores = self.score_candidates(batch_prompts, audios, n_candidate_per_text)
+                best = batch_scores.argmax(axis=1)
+                selected = [audios[idx * n_candidate_per_text + best[idx]] for idx in range(len(batch_prompts))]
+                scores.extend(float(batch_scores[idx, best[idx]]) for idx in range(len(batch_prompts)))
+            else:
+                selected = list(audios)
+                scores.extend([None] * len(batch_prompts))
+
+            for sound, path in zip(selected, save_paths[batch_start:batch_start + prompts_per_batch]):
+                # 생성된 오디오를 wav 파일로 저장
+                sf.write(str(path), sound, sample_rate)
+
+            del audios, selected
+            if self.device.startswith("cuda"):
+                torch.cuda.empty_cache()
+        return scores
+
+
+# 스케줄러 × 단계 수 조합별 생성 시간과 CLAP 점수(품질 지표) 측정
+def benchmark_audioldm2(prompts: List[str],
+                        schedulers: List[str],
+                        steps_list: List[int],
+                        device: str = "cuda",
+                        seed: int = 0,
+                        save_dir: str = "./cache/benchmark/audioldm2") -> List[Dict]:
+    save_dir = Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    synthesizer = AudioLDM2Synthesizer(device=device)
+    sample_rate = synthesizer.pipe.vocoder.config.sampling_rate
+    results = []
+    for scheduler in schedulers:
+        synthesizer.set_scheduler(scheduler)
+        for steps in steps_list:
+            save_paths = [save_dir / f"{scheduler}_{steps}_{idx}.wav" for idx in range(len(prompts))]
+            if device.startswith("cuda"):
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            synthesizer.call(prompts, save_paths, sample_rate=sample_rate, seed=seed, ddim_steps=steps,
+                             max_waveforms_per_batch=len(prompts))
+            if device.startswith("cuda"):
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+            audios = np.stack([sf.read(str(path), dtype="float32")[0] for path in save_paths])
+            clap_scores = synthesizer.score_candidates(prompts, audios, 1)[:, 0]
+            results.append({
+                "scheduler": scheduler,
+                "steps": steps,
+                "elapsed": elapsed,
+                "seconds_per_clip": elapsed / len(prompts),
+                "clap_score": float(clap_scores.mean()),
+            })
+            print(f"[INFO] {scheduler} {steps} steps: 클립당 {elapsed / len(prompts):.2f}s, "
+                  f"CLAP {results[-1]['clap_score']:.2f}")
+    return results
+
 
 # 사운드 에이전트 등록: "audioldm2_t2a" (text-to-audio)
 @register_tool("audioldm2_t2a")
@@ -69,32 +186,83 @@ class AudioLDM2Agent:
         save_paths = []
         forward_prompts = []
         save_path = Path(save_path)  # 문자열 → Path 객체
+        page_indices = []
         for idx in range(len(pages)):
             if sound_prompts[idx] != "No sounds.":  # 효과음 필요 없는 경우 제외
                 save_paths.append(save_path / f"p{idx + 1}.wav")  # 각 페이지 별 파일명
                 forward_prompts.append(sound_prompts[idx])
+                page_indices.append(idx)
+
+        # 2-1. 사운드 라이브러리에 비슷한 프롬프트의 클립이 있으면 생성하지 않고 재사용
+        library_cfg = self.cfg.get("library", {})
+        library = None
+        library_hits = []
+        if library_cfg.get("enabled", False) and len(forward_prompts) > 0:
+            library = SoundLibrary(library_cfg.get("dir", "./cache/sound_library"),
+                                   threshold=library_cfg.get("threshold", 0.9))
+            embedder = ClapTextEmbedder(device=library_cfg.get("device", "cpu"))
+            embeddings = embedder.embed(forward_prompts)
+            remaining = []
+            for prompt_idx, (prompt, path, embedding) in enumerate(zip(forward_prompts, save_paths, embeddings)):
+                match = library.lookup(embedding)
+                if match is None:
+                    remaining.append(prompt_idx)
+                    continue
+                entry, similarity = match
+                # 저장된 클립의 샘플레이트가 현재 설정과 다르면 출력 샘플레이트로 리샘플링
+                if library_cfg.get("vary", True):
+                    library.vary(entry, path,
+                                 seed=params.get("seed", 0) + page_indices[prompt_idx],
+                                 max_shift=library_cfg.get("max_shift", 2.0),
+                                 gain_db=library_cfg.get("gain_db", 2.0),
+                                 sample_rate=self.cfg.get("sample_rate", 16000))
+                else:
+                    sf.write(str(path), *library.read(entry, self.cfg.get("sample_rate", 16000)))
+                library_hits.append({"page": page_indices[prompt_idx] + 1, "prompt": prompt,
+                                     "library_prompt": entry["prompt"], "similarity": similarity})
+            print(f"[INFO] 사운드 라이브러리 재사용 {len(library_hits)}/{len(forward_prompts)}개 "
+                  f"(라이브러리 {len(library)}개 클립)")
+            forward_prompts = [forward_prompts[idx] for idx in remaining]
+            save_paths = [save_paths[idx] for idx in remaining]
+            embeddings = embeddings[remaining]
 
-        # 3. 오디오 생성기 초기화
-        generation_agent = AudioLDM2Synthesizer(
-            device=self.cfg.get("device", "cuda")
-        )
+        # 3. 오디오 생성기 초기화 (preset이 있으면 preset의 스케줄러/단계 수 사용)
+        scheduler = self.cfg.get("scheduler", "ddim")
+        steps = params.get("ddim_steps", 100)
+        preset = params.get("preset")
+        if preset is not None:
+            if preset not in SOUND_PRESETS:
+                raise ValueError(f"지원하지 않는 preset입니다: {preset} (가능: {list(SOUND_PRESETS)})")
+            scheduler = SOUND_PRESETS[preset]["scheduler"]
+            steps = SOUND_PRESETS[preset]["steps"]
 
-        # 4. 실제 오디오 생성 및 저장
+        # 4. 실제 오디오 생성 및 저장 (micro-batch마다 저장)
+        scores = []
         if len(forward_prompts) > 0:
-            sounds = generation_agent.call(
+            generation_agent = AudioLDM2Synthesizer(
+                device=self.cfg.get("device", "cuda"),
+                scheduler=scheduler
+            )
+            scores = generation_agent.call(
                 forward_prompts,
-                n_candidate_per_text=params.get("n_candidate_per_text", 3),
+                save_paths,
+                sample_rate=self.cfg.get("sample_rate", 16000),
+                n_candidate_per_text=params.get("n_candidate_per_text", 1),
                 seed=params.get("seed", 0),
                 guidance_scale=params.get("guidance_scale", 3.5),
-                ddim_steps=params.get("ddim_steps", 100),
+                ddim_steps=steps,
+                max_waveforms_per_batch=self.cfg.get("max_waveforms_per_batch", 4),
             )
-            for sound, path in zip(sounds, save_paths):
-                # 생성된 오디오를 wav 파일로 저장
-                sf.write(path.__str__(), sound, self.cfg["sample_rate"])
+            # 새로 생성한 클립은 다음 스토리에서 재사용할 수 있도록 라이브러리에 추가
+            if library is not None:
+                for prompt, path, embedding in zip(forward_prompts, save_paths, embeddings):
+                    library.add(prompt, embedding, path, self.cfg.get("sample_rate", 16000))
 
-        # 결과로 생성된 프롬프트 목록 반환
+        # 결과로 생성된 프롬프트 목록, 선택된 후보의 CLAP 점수, 라이브러리 재사용 내역 반환
         return {
             "prompts": sound_prompts,
+            "scores": scores,
+            "library_hits": library_hits,
         }
 
     #  스토리로부터 효과음 설명 프롬프트 생성
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Optional, Union
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+# 여러 프로세스(스토리)가 같은 라이브러리에 동시에 추가할 때 인덱스 갱신을 직렬화 (fcntl이 없는 환경에서는 잠금 없이 동작)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 생성된 효과음을 프롬프트 텍스트 임베딩과 함께 보관하는 로컬 사운드 라이브러리
+# 새 프롬프트와 코사인 유사도가 threshold 이상인 클립이 있으면 AudioLDM2 생성 대신 재사용(약간의 변형 포함)
+# 디스크 구성: embeddings.npy (N x D, L2 정규화), entries.json (프롬프트/파일 메타데이터), clips/{id}.wav
+
+
+# AudioLDM2와 같은 CLAP 텍스트 인코더로 프롬프트 임베딩 (디퓨전 파이프라인 전체를 올리지 않음)
+class ClapTextEmbedder:
+    def __init__(self, model_name: str = "cvssp/audioldm2", device: str = "cpu") -> None:
+        import torch
+        from transformers import AutoTokenizer, ClapModel
+
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, subfolder="tokenizer")
+        self.model = ClapModel.from_pretrained(model_name, subfolder="text_encoder").to(device)
+        self.model.eval()
+        self._torch = torch
+
+    # 프롬프트 목록 → L2 정규화된 임베딩 [N, D]
+    def embed(self, prompts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(prompts, padding=True, return_tensors="pt").to(self.device)
+        with self._torch.no_grad():
+            features = self.model.get_text_features(**inputs)
+        features = features.float().cpu().numpy()
+        return features / np.linalg.norm(features, axis=1, keepdims=True).clip(min=1e-8)
+
+
+class SoundLibrary:
+    def __init__(self, library_dir: str = "./cache/sound_library", threshold: float = 0.9) -> None:
+        self.library_dir = Path(library_dir)
+        self.clip_dir = self.library_dir / "clips"
+        self.clip_dir.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.entries: List[Dict] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self._load()
+
+    def _load(self):
+        entries_path = self.library_dir / "entries.json"
+        embeddings_path = self.library_dir / "embeddings.npy"
+        if entries_path.exists() and embeddings_path.exists():
+            with open(entries_path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+            self.embeddings = np.load(embeddings_path)
+
+    # 인덱스를 임시 파일에 쓴 뒤 교체하여 중간에 중단되어도 깨진 인덱스가 남지 않도록 함
+    def _save(self):
+        tmp_embeddings = self.library_dir / f"embeddings.{os.getpid()}.tmp.npy"
+        np.save(tmp_embeddings, self.embeddings)
+        os.replace(tmp_embeddings, self.library_dir / "embeddings.npy")
+        tmp_entries = self.library_dir / f"entries.{os.getpid()}.tmp"
+        with open(tmp_entries, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_entries, self.library_dir / "entries.json")
+
+    # 라이브러리 디렉터리 단위의 프로세스 간 배타 잠금
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.library_dir / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # 가장 유사한 클립 검색 → (항목, 유사도), threshold 미만이면 None
+    def lookup(self, embedding: np.ndarray):
+        if self.embeddings is None or len(self.entries) == 0:
+            return None
+        similarities = self.embeddings @ embedding
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return self.entries[best], float(similarities[best])
+
+    def clip_path(self, entry: Dict) -> Path:
+        return self.clip_dir / entry["file"]
+
+    # 생성된 클립을 라이브러리에 추가
+    # 잠금 안에서 인덱스를 다시 읽은 뒤 덧붙여 다른 프로세스가 그사이 추가한 항목을 덮어쓰지 않음
+    def add(self, prompt: str, embedding: np.ndarray, source_file: Union[str, Path], sample_rate: int) -> Dict:
+        clip_id = hashlib.sha256(f"{prompt}|{time.time()}".encode("utf-8")).hexdigest()[:16]
+        entry = {
+            "id": clip_id,
+            "prompt": prompt,
+            "file": f"{clip_id}.wav",
+            "sample_rate": sample_rate,
+            "created": time.time(),
+        }
+        shutil.copyfile(source_file, self.clip_dir / entry["file"])
+        embedding = embedding[None].astype(np.float32)
+        with self._locked():
+            self._load()
+            self.embeddings = embedding if self.embeddings is None else np.concatenate([self.embeddings, embedding])
+            self.entries.append(entry)
+            self._save()
+        return entry
+
+    # 클립 파형 로드 (sample_rate가 주어지고 저장된 샘플레이트와 다르면 리샘플링)
+    def read(self, entry: Dict, sample_rate: int = None):
+        audio, clip_rate = sf.read(self.clip_path(entry), dtype="float32")
+        if sample_rate is not None and clip_rate != sample_rate:
+            audio = librosa.resample(audio, orig_sr=clip_rate, target_sr=sample_rate, axis=0)
+            clip_rate = sample_rate
+        return audio, clip_rate
+
+    # 재사용 클립에 가벼운 변형 적용: 시작 위치 이동(max_shift초 이내, 클립 길이의 절반까지)과 gain(±gain_db)
+    # 앞부분을 잘라낸 만큼 끝에 무음을 붙여 길이를 유지하고, 잘린 시작과 끝에 fade_s초 fade를 넣어 클릭음을 막음
+    # seed가 같으면 같은 변형을 만들어 결과가 재현 가능
+    def vary(self, entry: Dict, save_path: Union[str, Path], seed: int = 0,
+             max_shift: float = 2.0, gain_db: float = 2.0, sample_rate: int = None, fade_s: float = 0.02):
+        audio, sample_rate = self.read(entry, sample_rate)
+        rng = np.random.default_rng(seed)
+        shift = int(rng.uniform(0, max_shift) * sample_rate) if max_shift > 0 else 0
+        shift = min(shift, len(audio) // 2)
+        gain = 10 ** (rng.uniform(-gain_db, gain_db) / 20) if gain_db > 0 else 1.0
+        if shift > 0:
+            shifted = audio[shift:] * gain
+            fade = min(int(fade_s * sample_rate), len(shifted) // 2)
+            if fade > 0:
+                ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32).reshape((-1,) + (1,) * (audio.ndim - 1))
+                shifted[:fade] *= ramp
+                shifted[-fade:] *= ramp[::-1]
+            audio = np.concatenate([shifted, np.zeros((shift,) + audio.shape[1:], dtype=audio.dtype)])
+        else:
+            audio = audio * gain
+        sf.write(str(save_path), np.clip(audio, -1.0, 1.0), sample_rate)
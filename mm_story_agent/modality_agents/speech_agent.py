@@ -1,61 +1,429 @@
 import os
+import re
+import json
+import time
+import shutil
+import hashlib
 import asyncio
-import edge_tts
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import librosa
+import soundfile as sf
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from mm_story_agent.base import register_tool
+from mm_story_agent.modality_agents.tts_backends import TTSBackend, EdgeTTSBackend, build_tts_backend
 
-# 마이크로소프트의 엣지의 TTS(음성 합성) API인 edget_tts를 활용하여 텍스트 페이지들을 음성 파일로 저장하는 기능을 수행합니다.
+# TTS 백엔드(기본: 마이크로소프트 엣지의 TTS API인 edge_tts, 로컬 mms, 테스트용 dummy)를 활용하여 텍스트 페이지들을 음성 파일로 저장하는 기능을 수행합니다.
 # 전체 구조는 2개의 클래스로 나뉘며, @register_tool("cosyvoice_tts")를 통해 에이전트 시스템에 등록
 
-# 실제 TTS 합성을 수행하는 비동기 음성 합성 도구 클래스
-class EdgeTTSSynthesizer:
-    # 한국어 음성 설정
-    def __init__(self) -> None:
-        self.default_voice = "ko-KR-SunHiNeural"
-    
-    # 주어진 Text, voice로 TTS 수행후 output_file에 저장
-    async def synthesize_async(self, text: str, voice: str, output_file: str):
-        communicate = edge_tts.Communicate(text, voice)
-        await communicate.save(output_file)
-    
-    # 런타임에 따른 적절한 비동기 처리 (여러 음성 병렬 처리)
-    def call(self, save_file, transcript, voice="ko-KR-SunHiNeural", sample_rate=16000):
-        os.makedirs(os.path.dirname(save_file), exist_ok=True)
-        voice = voice or self.default_voice
-        
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                asyncio.ensure_future(self.synthesize_async(transcript, voice, save_file))
+
+# LUFS 측정용 (설치되어 있지 않으면 RMS만 기록)
+try:
+    import pyloudnorm
+except ImportError:
+    pyloudnorm = None
+
+
+# 문장 단위로 분리 (문장부호 뒤 공백 기준, 문장부호는 앞 문장에 남김)
+def split_sentences(text: str) -> List[str]:
+    sentences = re.split(r"(?<=[.!?。！？…])\s+", text.strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+# 캐시된 파일을 출력 위치로 가져옴 (가능하면 하드 링크, 다른 파일시스템이면 복사)
+def _link_or_copy(src: Path, dst: Path):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# 정규화된 텍스트, 백엔드, 음성, 속도/피치, 출력 샘플레이트를 키로 하는 내용 주소 기반 TTS 캐시 (전체 크기 제한, 오래 안 쓴 항목부터 삭제)
+class TTSCache:
+    # 출력 파일 형식이 바뀌면 이전 항목을 재사용하지 않도록 키에 포함
+    FORMAT = "pcm16-wav-mono"
+
+    def __init__(self, cache_dir: str = "./cache/tts", max_bytes: int = 2 * 1024 ** 3) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # 캐시 전체 크기의 누적값 (처음 put할 때 한 번 디렉터리를 훑어 초기화, 이후 put마다 더함)
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return unicodedata.normalize("NFC", " ".join(text.split()))
+
+    def key(self, text: str, voice: str, rate: str, pitch: str, sample_rate: int, backend: str = "edge") -> str:
+        payload = json.dumps({
+            "text": self.normalize_text(text),
+            "backend": backend,
+            "voice": voice,
+            "rate": rate,
+            "pitch": pitch,
+            "sample_rate": sample_rate,
+            "format": self.FORMAT,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str):
+        entry_dir = self.cache_dir / key[:2]
+        return entry_dir / f"{key}.wav", entry_dir / f"{key}.json"
+
+    # 캐시 적중 시 output_file로 링크/복사하고 타이밍 정보 반환
+    def get(self, key: str, output_file) -> Optional[Dict]:
+        audio_path, meta_path = self._paths(key)
+        if not (audio_path.exists() and meta_path.exists()):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            timing = json.load(f)
+        _link_or_copy(audio_path, Path(output_file))
+        # 최근 사용 시간 갱신 (eviction 순서 기준)
+        os.utime(audio_path)
+        return timing
+
+    # 항목 저장 후 누적 크기가 max_bytes를 넘을 때만 eviction (디렉터리 전체 스캔은 그때만 수행)
+    def put(self, key: str, source_file, timing: Dict):
+        audio_path, meta_path = self._paths(key)
+        audio_path.parent.mkdir(parents=True, exist_ok=True)
+        replaced = self._entry_size(audio_path, meta_path)
+        # 임시 파일에 쓴 뒤 교체하여 동시 실행 시 깨진 항목이 남지 않도록 함
+        tmp_audio = audio_path.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(source_file, tmp_audio)
+        os.replace(tmp_audio, audio_path)
+        tmp_meta = meta_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(timing, f, ensure_ascii=False)
+        os.replace(tmp_meta, meta_path)
+        added = self._entry_size(audio_path, meta_path) - replaced
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
             else:
-                loop.run_until_complete(self.synthesize_async(transcript, voice, save_file))
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(self.synthesize_async(transcript, voice, save_file))
-        
-# 여러 페이지 텍스트를 순차적으로 음성 파일로 생성하는 에이전트 클래스 ( 내부에서 TTS 실행을 위해 EdgeTTSSynthesizer을 호출)
+                self._total_bytes += added
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    @staticmethod
+    def _entry_size(audio_path: Path, meta_path: Path) -> int:
+        size = 0
+        for path in (audio_path, meta_path):
+            try:
+                size += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    # (항목 목록, 전체 크기): 항목은 (최근 사용 시간, 크기, 음성 경로, 메타 경로)
+    def _scan(self):
+        entries = []
+        total = 0
+        for audio_path in self.cache_dir.glob("*/*.wav"):
+            meta_path = audio_path.with_suffix(".json")
+            try:
+                stat = audio_path.stat()
+                size = stat.st_size + (meta_path.stat().st_size if meta_path.exists() else 0)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, audio_path, meta_path))
+            total += size
+        return entries, total
+
+    # 전체 크기가 max_bytes를 넘으면 가장 오래 사용하지 않은 항목부터 삭제
+    # 다른 프로세스가 같은 캐시를 쓸 수 있으므로 실제 디렉터리 기준으로 다시 계산하고 누적값을 맞춤
+    def evict(self):
+        with self._lock:
+            entries, total = self._scan()
+            if total > self.max_bytes:
+                for _, size, audio_path, meta_path in sorted(entries, key=lambda entry: entry[0]):
+                    for path in (audio_path, meta_path):
+                        if path.exists():
+                            path.unlink()
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._total_bytes = total
+
+
+# 음량 정보: compose_video와 같은 방식의 RMS(프레임 RMS 평균), dBFS, LUFS(pyloudnorm이 있을 때)
+def measure_loudness(audio: np.ndarray, sample_rate: int) -> Dict:
+    rms = float(librosa.feature.rms(y=audio)[0].mean()) if len(audio) else 0.0
+    loudness = {
+        "rms": rms,
+        "rms_db": float(20 * np.log10(max(rms, 1e-10))),
+        "lufs": None,
+    }
+    # BS.1770 게이팅 블록(400ms)보다 짧으면 LUFS를 측정할 수 없음
+    if pyloudnorm is not None and len(audio) >= int(0.4 * sample_rate):
+        lufs = pyloudnorm.Meter(sample_rate).integrated_loudness(audio.astype(np.float64))
+        loudness["lufs"] = float(lufs) if np.isfinite(lufs) else None
+    return loudness
+
+
+# 코루틴을 끝까지 실행 (이미 이벤트 루프가 돌고 있으면 별도 스레드의 새 루프에서 실행하여 결과를 기다림)
+def _run_coroutine(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+# 실제 TTS 합성을 수행하는 비동기 음성 합성 도구 클래스 (합성 엔진은 TTSBackend로 교체 가능)
+class TTSSynthesizer:
+    # 한국어 음성 설정 (cache가 주어지면 같은 텍스트/백엔드/음성 설정의 결과를 재사용)
+    def __init__(self, backend: TTSBackend = None, cache: TTSCache = None) -> None:
+        self.default_voice = "ko-KR-SunHiNeural"
+        self.backend = backend if backend is not None else EdgeTTSBackend()
+        self.cache = cache
+
+    # 주어진 Text, voice로 TTS 수행후 sample_rate의 mono PCM WAV로 변환하여 output_file에 저장
+    # 반환값: 길이, 단어 경계(초 단위), 음량 정보
+    async def synthesize_async(self, text: str, voice: str, output_file: str,
+                               rate: str = "+0%", pitch: str = "+0Hz", sample_rate: int = 16000) -> Dict:
+        result = await self.backend.synthesize(text, voice, rate=rate, pitch=pitch)
+        # 리샘플링, 파일 쓰기, 음량 측정은 블로킹 작업이므로 스레드에서 실행하여 다른 발화의 합성이 계속 진행되게 함
+        timing = await asyncio.get_running_loop().run_in_executor(
+            None, self._write_output, result["audio"], result["sample_rate"], output_file, sample_rate)
+        return {**timing, "words": result["words"]}
+
+    # 합성 시점에 한 번만 리샘플링하여 compose_video가 그대로 읽을 수 있는 PCM WAV로 저장
+    @staticmethod
+    def _write_output(audio: np.ndarray, source_rate: int, output_file: str, sample_rate: int) -> Dict:
+        if source_rate != sample_rate:
+            audio = librosa.resample(audio, orig_sr=source_rate, target_sr=sample_rate)
+        sf.write(output_file, audio, sample_rate, subtype="PCM_16")
+        return {
+            "duration": len(audio) / sample_rate,
+            "num_samples": len(audio),
+            **measure_loudness(audio, sample_rate),
+        }
+
+    # 작업 하나를 semaphore 안에서 실행하고 실패 시 지수 백오프로 재시도
+    async def _synthesize_job(self, job: Dict, semaphore: asyncio.Semaphore, max_retries: int, retry_delay: float):
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(job["transcript"], job["voice"], job["rate"], job["pitch"], job["sample_rate"],
+                                       backend=self.backend.cache_id)
+            timing = self.cache.get(cache_key, job["save_file"])
+            if timing is not None:
+                return {
+                    "save_file": str(job["save_file"]),
+                    "latency": time.perf_counter() - start,
+                    "attempts": 0,
+                    "cached": True,
+                    **timing,
+                }
+
+        async with semaphore:
+            start = time.perf_counter()
+            # 출력 위치가 캐시 항목의 하드 링크일 수 있으므로 덮어쓰기 전에 링크를 끊음
+            if os.path.lexists(job["save_file"]):
+                os.remove(job["save_file"])
+            for attempt in range(max_retries + 1):
+                try:
+                    timing = await self.synthesize_async(job["transcript"], job["voice"], str(job["save_file"]),
+                                                         rate=job["rate"], pitch=job["pitch"],
+                                                         sample_rate=job["sample_rate"])
+                    if cache_key is not None:
+                        # 파일 복사와 (필요 시) eviction은 이벤트 루프 밖에서 실행
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.cache.put, cache_key, job["save_file"], timing)
+                    return {
+                        "save_file": str(job["save_file"]),
+                        "latency": time.perf_counter() - start,
+                        "attempts": attempt + 1,
+                        "cached": False,
+                        **timing,
+                    }
+                except Exception as e:
+                    if attempt == max_retries:
+                        raise
+                    print(f"[WARN] TTS 합성 실패 ({job['save_file']}), 재시도 {attempt + 1}/{max_retries}: {e}")
+                    await asyncio.sleep(retry_delay * 2 ** attempt)
+
+    # 모든 작업을 동시에 제출하고 (최대 max_concurrency개) 전부 끝날 때까지 기다림
+    async def synthesize_batch_async(self,
+                                     jobs: List[Dict],
+                                     max_concurrency: int = 4,
+                                     max_retries: int = 3,
+                                     retry_delay: float = 1.0) -> List[Dict]:
+        semaphore = asyncio.Semaphore(max_concurrency)
+        results = await asyncio.gather(
+            *[self._synthesize_job(job, semaphore, max_retries, retry_delay) for job in jobs],
+            return_exceptions=True
+        )
+        failed = [(job["save_file"], result) for job, result in zip(jobs, results) if isinstance(result, Exception)]
+        if failed:
+            details = ", ".join(f"{save_file}: {error}" for save_file, error in failed)
+            raise RuntimeError(f"TTS 합성 실패 {len(failed)}/{len(jobs)}건 - {details}")
+        return results
+
+    # 동기 환경에서 배치 합성 실행
+    # jobs: [{"save_file", "transcript", "voice", "rate", "pitch", "sample_rate"}]
+    def call_batch(self, jobs: List[Dict], max_concurrency: int = 4, max_retries: int = 3, retry_delay: float = 1.0):
+        for job in jobs:
+            os.makedirs(os.path.dirname(job["save_file"]), exist_ok=True)
+            job["voice"] = job.get("voice") or self.default_voice
+            job.setdefault("rate", "+0%")
+            job.setdefault("pitch", "+0Hz")
+            job.setdefault("sample_rate", 16000)
+        return _run_coroutine(self.synthesize_batch_async(jobs, max_concurrency, max_retries, retry_delay))
+
+    # 단일 음성 합성
+    def call(self, save_file, transcript, voice="ko-KR-SunHiNeural", sample_rate=16000, rate="+0%", pitch="+0Hz"):
+        return self.call_batch([{
+            "save_file": save_file,
+            "transcript": transcript,
+            "voice": voice,
+            "rate": rate,
+            "pitch": pitch,
+            "sample_rate": sample_rate,
+        }], max_concurrency=1)[0]
+
+
+# 기존 호출부 호환용: edge-tts 백엔드를 쓰는 TTSSynthesizer
+class EdgeTTSSynthesizer(TTSSynthesizer):
+    def __init__(self, cache: TTSCache = None) -> None:
+        super().__init__(backend=EdgeTTSBackend(), cache=cache)
+
+
+# TTS 백엔드 처리량 측정: 같은 문장들을 동시성별로 합성하여 wall time, 초당 발화 수, real-time factor 기록 (캐시 미사용)
+def benchmark_tts(backend: TTSBackend,
+                  texts: List[str],
+                  save_dir: str,
+                  concurrency_levels: List[int] = (1, 4),
+                  voice: str = "ko-KR-SunHiNeural",
+                  sample_rate: int = 16000) -> List[Dict]:
+    synthesizer = TTSSynthesizer(backend=backend)
+    results = []
+    for max_concurrency in concurrency_levels:
+        jobs = [
+            {
+                "save_file": os.path.join(save_dir, f"c{max_concurrency}_{idx}.wav"),
+                "transcript": text,
+                "voice": voice,
+                "sample_rate": sample_rate,
+            }
+            for idx, text in enumerate(texts)
+        ]
+        start = time.perf_counter()
+        outputs = synthesizer.call_batch(jobs, max_concurrency=max_concurrency, max_retries=0)
+        elapsed = time.perf_counter() - start
+        audio_seconds = sum(output["duration"] for output in outputs)
+        latencies = sorted(output["latency"] for output in outputs)
+        results.append({
+            "backend": backend.cache_id,
+            "max_concurrency": max_concurrency,
+            "utterances": len(jobs),
+            "audio_seconds": audio_seconds,
+            "elapsed": elapsed,
+            "utterances_per_second": len(jobs) / elapsed,
+            "rtf": elapsed / audio_seconds if audio_seconds else None,
+            "p50_latency": latencies[len(latencies) // 2],
+            "max_latency": latencies[-1],
+        })
+        print(f"[INFO] {backend.cache_id} 동시성 {max_concurrency}: {len(jobs)}개 발화 {elapsed:.2f}s "
+              f"({len(jobs) / elapsed:.2f} 발화/s, RTF {results[-1]['rtf']:.3f})")
+    return results
+
+
+# 여러 페이지 텍스트를 동시에 음성 파일로 생성하는 에이전트 클래스 ( 내부에서 TTS 실행을 위해 TTSSynthesizer을 호출)
+# sentence_level이면 문장마다 p{n}_{k}.wav로 나누어 합성하고, 페이지별 타이밍 정보를 p{n}.json에 저장
 @register_tool("cosyvoice_tts")
 class CosyVoiceAgent:
     # 설정파일이나 dictionary 객체를 저장
     def __init__(self, cfg) -> None:
         self.cfg = cfg
-    
+
+    # 이전 실행에서 남은 같은 페이지의 음성 파일 제거 (compose_video가 p{n}.wav를 우선 사용하므로)
+    def _clear_page(self, save_path: Path, page_idx: int):
+        for stale in [save_path / f"p{page_idx}.wav", *save_path.glob(f"p{page_idx}_*.wav")]:
+            if stale.exists():
+                stale.unlink()
+
     # 각 페이지별 텍스트 리스트와 음성 파일을 저장할 경로
     def call(self, params: Dict):
         pages: List = params["pages"]
-        save_path: str = params["save_path"]
-        generation_agent = EdgeTTSSynthesizer()
-        
+        save_path = Path(params["save_path"])
+        save_path.mkdir(parents=True, exist_ok=True)
+        sentence_level = self.cfg.get("sentence_level", True)
+        cache_cfg = self.cfg.get("cache", {})
+        cache = None
+        if cache_cfg.get("enabled", True):
+            cache = TTSCache(cache_cfg.get("dir", "./cache/tts"),
+                             max_bytes=int(cache_cfg.get("max_size_mb", 2048) * 1024 ** 2))
+        backend = build_tts_backend(self.cfg.get("backend", "edge"), **self.cfg.get("backend_cfg", {}))
+        generation_agent = TTSSynthesizer(backend=backend, cache=cache)
+
+        jobs = []
+        page_jobs = []
         for idx, page in enumerate(pages):
-            generation_agent.call(
-                save_file=save_path / f"p{idx + 1}.wav",
-                transcript=page,
-                voice=params.get("voice", "ko-KR-SunHiNeural"),
-                sample_rate=self.cfg.get("sample_rate", 16000)
-            )
+            self._clear_page(save_path, idx + 1)
+            if sentence_level:
+                utterances = split_sentences(page) or [page]
+                file_names = [f"p{idx + 1}_{utt_idx}.wav" for utt_idx in range(len(utterances))]
+            else:
+                utterances = [page]
+                file_names = [f"p{idx + 1}.wav"]
+            page_jobs.append([])
+            for utterance, file_name in zip(utterances, file_names):
+                page_jobs[-1].append(len(jobs))
+                jobs.append({
+                    "save_file": save_path / file_name,
+                    "transcript": utterance,
+                    "voice": params.get("voice", "ko-KR-SunHiNeural"),
+                    "rate": params.get("rate", "+0%"),
+                    "pitch": params.get("pitch", "+0Hz"),
+                    "sample_rate": self.cfg.get("sample_rate", 16000),
+                })
+
+        start = time.perf_counter()
+        results = generation_agent.call_batch(
+            jobs,
+            max_concurrency=self.cfg.get("max_concurrency", 4),
+            max_retries=self.cfg.get("max_retries", 3),
+            retry_delay=self.cfg.get("retry_delay", 1.0)
+        )
+        latencies = [result["latency"] for result in results]
+        num_cached = sum(result["cached"] for result in results)
+        print(f"[INFO] 음성 합성 완료: {len(pages)}페이지 {len(jobs)}개 발화 (캐시 {num_cached}개), "
+              f"전체 {time.perf_counter() - start:.1f}s, 최장 발화 {max(latencies, default=0.0):.1f}s")
+
+        # 페이지별 사이드카: 샘플레이트, 발화 순서, 텍스트, 길이, 단어 경계(발화 시작 기준 초), 음량
+        for idx, job_indices in enumerate(page_jobs):
+            timing = {
+                "page": idx + 1,
+                "sample_rate": self.cfg.get("sample_rate", 16000),
+                "backend": backend.cache_id,
+                "utterances": [
+                    {
+                        "file": Path(jobs[job_idx]["save_file"]).name,
+                        "text": jobs[job_idx]["transcript"],
+                        "duration": results[job_idx]["duration"],
+                        "num_samples": results[job_idx]["num_samples"],
+                        "words": results[job_idx]["words"],
+                        "rms": results[job_idx]["rms"],
+                        "rms_db": results[job_idx]["rms_db"],
+                        "lufs": results[job_idx]["lufs"],
+                    }
+                    for job_idx in job_indices
+                ],
+            }
+            with open(save_path / f"p{idx + 1}.json", "w", encoding="utf-8") as f:
+                json.dump(timing, f, indent=4, ensure_ascii=False)
+
         # 스피치 반환
         return {
-            "modality": "speech"
+            "modality": "speech",
+            "latencies": latencies,
         }
@@ -0,0 +1,212 @@
+import sys
+import time
+import struct
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from mm_story_agent.modality_agents.whisper_utils import load_whisper_pipe
+
+# 실시간 입력(자라나는 파일 또는 stdin)을 조금씩 읽어 확정된 전사 구간을 순서대로 내보내는 스트리밍 인식기
+# 입력 형식: 16kHz mono s16le raw PCM 또는 같은 형식의 WAV
+# 예) ffmpeg -i mic -f s16le -ar 16000 -ac 1 - | python run.py -c configs/mm_story_agent.yaml -a - --stream
+
+SAMPLE_RATE = 16000
+
+
+# data 청크 전에 이만큼 읽어도 찾지 못하면 잘못된 WAV로 판단
+MAX_WAV_HEADER_BYTES = 1 << 16
+
+
+# WAV 헤더를 청크 단위로 해석하여 PCM 데이터 시작 위치 반환 (16kHz mono 16bit만 허용)
+# 아직 헤더가 다 들어오지 않았으면 None
+def _wav_data_offset(data: bytes):
+    if len(data) < 12:
+        return None
+    if data[8:12] != b"WAVE":
+        raise ValueError("RIFF 입력이지만 WAVE 형식이 아닙니다.")
+    offset = 12
+    fmt_checked = False
+    while True:
+        if len(data) < offset + 8:
+            return None
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        if chunk_id == b"data":
+            if not fmt_checked:
+                raise ValueError("WAV 헤더에 fmt 청크가 data 청크보다 먼저 있어야 합니다.")
+            return offset + 8
+        if chunk_id == b"fmt ":
+            if len(data) < offset + 8 + 16:
+                return None
+            channels, sample_rate = struct.unpack("<HI", data[offset + 10:offset + 16])
+            bits_per_sample = struct.unpack("<H", data[offset + 22:offset + 24])[0]
+            if channels != 1 or sample_rate != SAMPLE_RATE or bits_per_sample != 16:
+                raise ValueError(f"스트리밍 입력은 {SAMPLE_RATE}Hz mono 16bit여야 합니다. "
+                                 f"(channels={channels}, sample_rate={sample_rate}, bits={bits_per_sample})")
+            fmt_checked = True
+        # 청크 크기가 홀수면 1바이트 padding
+        offset += 8 + chunk_size + chunk_size % 2
+
+
+# 입력 소스에서 float32 PCM 청크를 읽는 제너레이터
+# source가 "-"면 stdin, 아니면 계속 자라나는 파일로 보고 idle_timeout 동안 변화가 없으면 종료
+# WAV 입력은 RIFF 헤더와 data 청크 시작까지 모두 들어온 뒤에 PCM을 내보냄
+def read_pcm_chunks(source: str,
+                    chunk_s: float = 0.5,
+                    poll_interval: float = 0.2,
+                    idle_timeout: float = 3.0) -> Iterator[np.ndarray]:
+    growing = source != "-"
+    stream = open(source, "rb") if growing else sys.stdin.buffer
+    chunk_bytes = int(SAMPLE_RATE * chunk_s) * 2
+    header = b""            # 형식이 확정되기 전까지 모은 앞부분
+    header_checked = False
+    leftover = b""
+    idle = 0.0
+    try:
+        while True:
+            data = stream.read(chunk_bytes)
+            if not data:
+                if not growing or idle >= idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                idle += poll_interval
+                continue
+            idle = 0.0
+            if not header_checked:
+                header += data
+                if len(header) < 4:
+                    continue
+                if header[:4] == b"RIFF":
+                    data_offset = _wav_data_offset(header)
+                    if data_offset is None:
+                        if len(header) > MAX_WAV_HEADER_BYTES:
+                            raise ValueError("WAV 헤더에서 data 청크를 찾을 수 없습니다.")
+                        continue
+                    data = header[data_offset:]
+                else:
+                    data = header
+                header_checked = True
+                header = b""
+            data = leftover + data
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        if header[:4] == b"RIFF":
+            raise ValueError("입력이 끝날 때까지 WAV 헤더의 data 청크가 들어오지 않았습니다.")
+        # 4바이트 미만으로 끝난 raw PCM 입력
+        usable = len(header) - len(header) % 2
+        if usable:
+            yield np.frombuffer(header[:usable], dtype="<i2").astype(np.float32) / 32768.0
+    finally:
+        if growing:
+            stream.close()
+
+
+class StreamingTranscriber:
+    """
+    버퍼에 쌓인 음성을 step_s마다 다시 전사하고, 연속된 두 번의 가설에서 같은 내용으로 나온 앞부분
+    구간(LocalAgreement)을 확정하여 내보냅니다. 확정된 구간의 음성은 버퍼에서 제거합니다.
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 whisper_cfg: dict = None,
+                 step_s: float = 2.0,
+                 max_buffer_s: float = 30.0,
+                 stability_margin_s: float = 1.0) -> None:
+        self.pipe = load_whisper_pipe(model_name, whisper_cfg)
+        self.step_s = step_s
+        self.max_buffer_s = max_buffer_s
+        self.stability_margin_s = stability_margin_s
+
+    # 현재 버퍼 전사 → [{"text", "start", "end"}] (버퍼 기준 시간)
+    def transcribe_buffer(self, audio: np.ndarray) -> List[Dict]:
+        result = self.pipe({"raw": audio, "sampling_rate": SAMPLE_RATE}, return_timestamps=True)
+        segments = []
+        for chunk in result.get("chunks", []):
+            start, end = chunk["timestamp"]
+            text = chunk["text"].strip()
+            if text:
+                segments.append({"text": text, "start": start or 0.0, "end": end})
+        return segments
+
+    # 이전 가설과 일치하고 버퍼 끝에서 충분히 떨어진 앞부분 구간 수
+    def _num_stable(self, previous: List[Dict], segments: List[Dict], buffer_duration: float) -> int:
+        num_stable = 0
+        for idx, segment in enumerate(segments):
+            if idx >= len(previous) or previous[idx]["text"] != segment["text"]:
+                break
+            if segment["end"] is None or segment["end"] > buffer_duration - self.stability_margin_s:
+                break
+            num_stable += 1
+        return num_stable
+
+    def stream(self, chunks: Iterable[np.ndarray]) -> Iterator[Dict]:
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_offset = 0.0     # 버퍼 시작의 절대 시간 (초)
+        pending = 0             # 마지막 전사 이후 새로 들어온 샘플 수
+        previous = []
+
+        for chunk in chunks:
+            buffer = np.concatenate([buffer, chunk])
+            pending += len(chunk)
+            if pending < self.step_s * SAMPLE_RATE:
+                continue
+            pending = 0
+
+            buffer_duration = len(buffer) / SAMPLE_RATE
+            segments = self.transcribe_buffer(buffer)
+            num_stable = self._num_stable(previous, segments, buffer_duration)
+            # 버퍼가 너무 길어지면 마지막 구간만 남기고 강제로 확정
+            if buffer_duration > self.max_buffer_s:
+                while num_stable < len(segments) - 1 and segments[num_stable]["end"] is not None:
+                    num_stable += 1
+                # 긴 구간 하나뿐이거나(타임스탬프 없음 포함) 무음만 있으면 버퍼 전체를 시간 기준으로 확정하고 비움
+                if num_stable == 0:
+                    for segment in segments:
+                        end = segment["end"] if segment["end"] is not None else buffer_duration
+                        yield {
+                            "text": segment["text"],
+                            "start": buffer_offset + segment["start"],
+                            "end": buffer_offset + end,
+                        }
+                    buffer = np.zeros(0, dtype=np.float32)
+                    buffer_offset += buffer_duration
+                    previous = []
+                    continue
+
+            if num_stable == 0:
+                previous = segments
+                continue
+
+            for segment in segments[:num_stable]:
+                yield {
+                    "text": segment["text"],
+                    "start": buffer_offset + segment["start"],
+                    "end": buffer_offset + segment["end"],
+                }
+
+            # 확정된 구간의 음성 제거 후 남은 가설을 새 버퍼 기준으로 이동
+            cut = segments[num_stable - 1]["end"]
+            buffer = buffer[int(cut * SAMPLE_RATE):]
+            buffer_offset += cut
+            previous = [
+                {
+                    "text": segment["text"],
+                    "start": max(segment["start"] - cut, 0.0),
+                    "end": None if segment["end"] is None else segment["end"] - cut,
+                }
+                for segment in segments[num_stable:]
+            ]
+
+        # 입력이 끝나면 남은 버퍼 전체를 확정
+        if len(buffer) > 0:
+            for segment in self.transcribe_buffer(buffer):
+                end = segment["end"] if segment["end"] is not None else len(buffer) / SAMPLE_RATE
+                yield {
+                    "text": segment["text"],
+                    "start": buffer_offset + segment["start"],
+                    "end": buffer_offset + end,
+                }
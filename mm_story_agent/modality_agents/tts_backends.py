@@ -0,0 +1,200 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+import threading
+from typing import Dict, List
+
+import numpy as np
+import soundfile as sf
+
+# TTS 엔진 백엔드 모음: 모든 백엔드는 같은 인터페이스로 mono float32 파형, 샘플레이트, 단어 경계를 반환
+# - edge  : Microsoft Edge 온라인 TTS (네트워크 필요)
+# - mms   : transformers VITS(facebook/mms-tts-*) 로컬 엔진 (CPU 가능, 네트워크 불필요)
+# - dummy : 텍스트 길이에 비례하는 결정적 톤을 만드는 테스트/벤치마크용 대역
+
+
+# 글자 수에 비례하여 단어 경계 추정 (엔진이 단어 경계를 주지 않을 때 사용)
+def estimate_word_boundaries(text: str, duration: float) -> List[Dict]:
+    words = [word for word in re.split(r"\s+", text.strip()) if word]
+    total_chars = sum(len(word) for word in words)
+    if total_chars == 0:
+        return []
+    boundaries = []
+    cursor = 0.0
+    for word in words:
+        word_duration = duration * len(word) / total_chars
+        boundaries.append({"text": word, "start": cursor, "end": cursor + word_duration})
+        cursor += word_duration
+    return boundaries
+
+
+# edge-tts 형식의 속도 문자열("+10%", "-20%")을 배속으로 변환
+def parse_rate(rate: str) -> float:
+    match = re.fullmatch(r"([+-]\d+(?:\.\d+)?)%", rate.strip())
+    return 1.0 + float(match.group(1)) / 100 if match else 1.0
+
+
+class TTSBackend:
+    """
+    TTS 백엔드 공통 인터페이스
+
+    synthesize()는 {"audio": mono float32 파형, "sample_rate": int, "words": [{"text", "start", "end"}]}를 반환합니다.
+    cache_id는 TTS 캐시 키에 포함되어 엔진/모델이 다르면 결과를 공유하지 않도록 합니다.
+    """
+    name = "base"
+
+    @property
+    def cache_id(self) -> str:
+        return self.name
+
+    async def synthesize(self, text: str, voice: str, rate: str = "+0%", pitch: str = "+0Hz") -> Dict:
+        raise NotImplementedError
+
+
+class EdgeTTSBackend(TTSBackend):
+    name = "edge"
+
+    # 단어 경계 이벤트를 받도록 Communicate 생성 (edge-tts 7.0 미만은 WordBoundary가 기본)
+    def _communicate(self, text: str, voice: str, rate: str, pitch: str):
+        import edge_tts
+
+        try:
+            return edge_tts.Communicate(text, voice, rate=rate, pitch=pitch, boundary="WordBoundary")
+        except TypeError:
+            return edge_tts.Communicate(text, voice, rate=rate, pitch=pitch)
+
+    # 인코딩된 음성(mp3) 바이트를 mono float32 파형으로 디코딩
+    def _decode(self, data: bytes):
+        try:
+            audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+            return audio.mean(axis=1), sample_rate
+        except RuntimeError:
+            # libsndfile 1.1 미만은 mp3를 읽지 못하므로 임시 파일을 거쳐 librosa(audioread)로 디코딩
+            import librosa
+
+            fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                audio, sample_rate = librosa.load(tmp_path, sr=None, mono=True)
+            finally:
+                os.remove(tmp_path)
+            return audio, sample_rate
+
+    async def synthesize(self, text: str, voice: str, rate: str = "+0%", pitch: str = "+0Hz") -> Dict:
+        communicate = self._communicate(text, voice, rate, pitch)
+        encoded = bytearray()
+        words = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                encoded.extend(chunk["data"])
+            elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                # offset/duration은 100ns 단위
+                words.append({
+                    "text": chunk["text"],
+                    "start": chunk["offset"] / 1e7,
+                    "end": (chunk["offset"] + chunk["duration"]) / 1e7,
+                })
+        # mp3 디코딩은 CPU 작업이므로 이벤트 루프를 막지 않도록 스레드에서 실행
+        audio, sample_rate = await asyncio.get_running_loop().run_in_executor(None, self._decode, bytes(encoded))
+        return {"audio": audio, "sample_rate": sample_rate, "words": words}
+
+
+class MMSTTSBackend(TTSBackend):
+    """
+    transformers의 VitsModel(facebook/mms-tts-kor 등)을 이용한 로컬 TTS
+    모델은 한 번만 로드하고, 추론은 별도 스레드에서 한 번에 하나씩 실행합니다 (voice, pitch는 사용하지 않음).
+    """
+    name = "mms"
+
+    def __init__(self, model_name: str = "facebook/mms-tts-kor", device: str = "cpu", num_threads: int = None) -> None:
+        import torch
+        from transformers import VitsModel, AutoTokenizer
+
+        if device == "cpu":
+            from mm_story_agent.utils.cpu_utils import configure_cpu_threads
+            configure_cpu_threads(num_threads)
+
+        self.model_name = model_name
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = VitsModel.from_pretrained(model_name).to(device)
+        self.model.eval()
+        self._torch = torch
+        self._lock = threading.Lock()
+        self._uroman = None
+
+    @property
+    def cache_id(self) -> str:
+        return f"{self.name}:{self.model_name}"
+
+    # 일부 언어(한국어 포함)는 uroman 로마자 변환 입력을 요구함
+    # Uroman은 생성 시 규칙 테이블을 읽으므로 처음 필요할 때 한 번만 만들어 재사용
+    def _prepare_text(self, text: str) -> str:
+        if getattr(self.tokenizer, "is_uroman", False):
+            if self._uroman is None:
+                import uroman
+
+                self._uroman = uroman.Uroman()
+            return self._uroman.romanize_string(text)
+        return text
+
+    def _generate(self, text: str, rate: str) -> np.ndarray:
+        inputs = self.tokenizer(self._prepare_text(text), return_tensors="pt").to(self.device)
+        with self._lock, self._torch.no_grad():
+            self.model.speaking_rate = parse_rate(rate)
+            waveform = self.model(**inputs).waveform[0]
+        return waveform.float().cpu().numpy()
+
+    async def synthesize(self, text: str, voice: str, rate: str = "+0%", pitch: str = "+0Hz") -> Dict:
+        audio = await asyncio.get_running_loop().run_in_executor(None, self._generate, text, rate)
+        sample_rate = self.model.config.sampling_rate
+        return {
+            "audio": audio,
+            "sample_rate": sample_rate,
+            "words": estimate_word_boundaries(text, len(audio) / sample_rate),
+        }
+
+
+class DummyTTSBackend(TTSBackend):
+    """
+    네트워크/모델 없이 동작하는 결정적 합성기 (테스트, 벤치마크용)
+    같은 텍스트/음성/속도는 항상 같은 파형을 만들고, 길이는 글자 수에 비례합니다.
+    """
+    name = "dummy"
+
+    def __init__(self, sample_rate: int = 24000, seconds_per_char: float = 0.08, latency: float = 0.0) -> None:
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.latency = latency
+
+    async def synthesize(self, text: str, voice: str, rate: str = "+0%", pitch: str = "+0Hz") -> Dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        duration = max(len(text.strip()), 1) * self.seconds_per_char / parse_rate(rate)
+        seed = int(hashlib.sha256(f"{voice}|{text}".encode("utf-8")).hexdigest()[:8], 16)
+        frequency = 150.0 + seed % 250
+        t = np.arange(int(duration * self.sample_rate), dtype=np.float32) / self.sample_rate
+        audio = (0.1 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+        return {
+            "audio": audio,
+            "sample_rate": self.sample_rate,
+            "words": estimate_word_boundaries(text, duration),
+        }
+
+
+TTS_BACKENDS = {
+    "edge": EdgeTTSBackend,
+    "mms": MMSTTSBackend,
+    "dummy": DummyTTSBackend,
+}
+
+
+# speech_generation.cfg.backend / backend_cfg로 백엔드 생성
+def build_tts_backend(name: str = "edge", **kwargs) -> TTSBackend:
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"지원하지 않는 TTS 백엔드입니다: {name} (가능: {list(TTS_BACKENDS)})")
+    return TTS_BACKENDS[name](**kwargs)
@@ -1,28 +1,385 @@
-from transformers import pipeline
+from transformers import pipeline, AutoModelForSpeechSeq2Seq, AutoProcessor
+from transformers.generation.streamers import BaseStreamer
 import torch
 # from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
 # import whisper
 import torch
 import torchaudio
 import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from mm_story_agent.utils.cpu_utils import configure_cpu_threads, quantize_linear_int8
+
 WHISPER_MODELS = [
     "seongsubae/openai-whisper-large-v3-turbo-ko-TEST",
     "openai/whisper-large-v3",
     "openai/whisper-medium"
 ]
 
+# assisted 모드 기본 target/assistant (같은 vocab, 같은 128 mel 입력이라 초안 채택률을 측정할 수 있음)
+DEFAULT_ASSISTED_MODEL = "openai/whisper-large-v3"
+DEFAULT_ASSISTANT_MODEL = "distil-whisper/distil-large-v3"
+
+
+# whisper.cfg.engine 값 해석 (auto면 GPU 유무에 따라 선택)
+def _resolve_engine(whisper_cfg: dict) -> str:
+    engine = whisper_cfg.get("engine", "transformers")
+    if engine == "auto":
+        engine = "transformers" if torch.cuda.is_available() else "cpu"
+    return engine
+
+
+# export된 ONNX 그래프(encoder/decoder)를 int8 dynamic quantization
+def _quantize_onnx_dir(onnx_dir: str):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    for file_name in os.listdir(onnx_dir):
+        if not file_name.endswith(".onnx") or file_name.endswith("_quantized.onnx"):
+            continue
+        model_input = os.path.join(onnx_dir, file_name)
+        model_output = os.path.join(onnx_dir, file_name.replace(".onnx", "_quantized.onnx"))
+        quantize_dynamic(model_input, model_output, weight_type=QuantType.QInt8,
+                         use_external_data_format=True)
+
+
+# ONNX Runtime(CPUExecutionProvider)용 Whisper 모델 로드 (최초 1회 export 후 재사용)
+def _load_onnx_whisper(model_name: str, whisper_cfg: dict, num_threads: int):
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+    quantize = whisper_cfg.get("quantize", "int8") == "int8"
+    onnx_dir = os.path.join(whisper_cfg.get("onnx_dir", "./model/onnx"), model_name.replace("/", "--"))
+    if not os.path.isdir(onnx_dir):
+        print(f"[INFO] ONNX 그래프 export 중... ({onnx_dir})")
+        ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True).save_pretrained(onnx_dir)
+        if quantize:
+            _quantize_onnx_dir(onnx_dir)
+
+    # 존재하는 그래프 파일만 지정 (quantize 시 *_quantized.onnx 우선)
+    file_kwargs = {}
+    for key, stem in [("encoder_file_name", "encoder_model"),
+                      ("decoder_file_name", "decoder_model"),
+                      ("decoder_with_past_file_name", "decoder_with_past_model")]:
+        candidates = [f"{stem}_quantized.onnx", f"{stem}.onnx"] if quantize else [f"{stem}.onnx"]
+        for candidate in candidates:
+            if os.path.exists(os.path.join(onnx_dir, candidate)):
+                file_kwargs[key] = candidate
+                break
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = num_threads
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ORTModelForSpeechSeq2Seq.from_pretrained(
+        onnx_dir,
+        provider="CPUExecutionProvider",
+        session_options=session_options,
+        **file_kwargs
+    )
+
+
+# GPU 없는 워커용 Whisper 파이프라인 (int8 quantization, 스레드 설정, ONNX 옵션)
+def _load_cpu_whisper_pipe(model_name: str, whisper_cfg: dict):
+    num_threads = configure_cpu_threads(whisper_cfg.get("num_threads"),
+                                        whisper_cfg.get("num_interop_threads"))
+    processor = AutoProcessor.from_pretrained(model_name)
+
+    if whisper_cfg.get("onnx", False):
+        model = _load_onnx_whisper(model_name, whisper_cfg, num_threads)
+    else:
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_name,
+            torch_dtype=torch.float32,
+            low_cpu_mem_usage=True
+        )
+        if whisper_cfg.get("quantize", "int8") == "int8":
+            model = quantize_linear_int8(model)
+
+    return pipeline(
+        task="automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        device=-1,
+        return_timestamps=True
+    )
+
 
-def transcribe_audio(audio_path: str, model_name: str) -> str:
-    print(f"[INFO] HuggingFace Whisper 모델 로드 중... (모델: {model_name})")
-    pipe = pipeline(
+# 설정된 엔진에 맞는 Whisper 파이프라인 생성
+def load_whisper_pipe(model_name: str, whisper_cfg: dict = None):
+    whisper_cfg = whisper_cfg or {}
+    engine = _resolve_engine(whisper_cfg)
+    print(f"[INFO] HuggingFace Whisper 모델 로드 중... (모델: {model_name}, 엔진: {engine})")
+    if engine == "cpu":
+        return _load_cpu_whisper_pipe(model_name, whisper_cfg)
+    return pipeline(
         task="automatic-speech-recognition",
         model=model_name,
         device=0 if torch.cuda.is_available() else -1,
         return_timestamps=True
     )
+
+
+def transcribe_audio(audio_path: str, model_name: str, whisper_cfg: dict = None) -> str:
+    pipe = load_whisper_pipe(model_name, whisper_cfg)
     result = pipe(audio_path)
     return result["text"].strip()
 
+
+# 음성 파일 길이(초)
+def _audio_duration(audio_path: str) -> float:
+    info = torchaudio.info(audio_path)
+    return info.num_frames / info.sample_rate
+
+
+# 모델별 로드 시간과 real-time factor(추론 시간 / 음성 길이) 측정
+def benchmark_whisper(audio_path: str, whisper_cfg: dict = None, model_names: list = None) -> list:
+    audio_duration = _audio_duration(audio_path)
+    results = []
+    for model_name in model_names or WHISPER_MODELS:
+        start = time.perf_counter()
+        pipe = load_whisper_pipe(model_name, whisper_cfg)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipe(audio_path)
+        infer_time = time.perf_counter() - start
+
+        results.append({
+            "model": model_name,
+            "engine": _resolve_engine(whisper_cfg or {}),
+            "audio_duration": audio_duration,
+            "load_time": load_time,
+            "infer_time": infer_time,
+            "rtf": infer_time / audio_duration,
+        })
+        print(f"[BENCH] {model_name}: load {load_time:.1f}s, infer {infer_time:.1f}s, "
+              f"RTF {infer_time / audio_duration:.3f}")
+        del pipe
+    return results
+
+# assisted 모드의 target/assistant 모델을 (model_name, device, dtype) 단위로 보관
+# 한 번의 전사(또는 벤치마크) 동안만 유지하고 끝나면 release_seq2seq_models()로 해제
+_SEQ2SEQ_CACHE = {}
+
+
+def release_seq2seq_models():
+    _SEQ2SEQ_CACHE.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _load_seq2seq(model_name: str, device: str, dtype):
+    key = (model_name, device, dtype)
+    if key not in _SEQ2SEQ_CACHE:
+        print(f"[INFO] HuggingFace Whisper 모델 로드 중... (모델: {model_name}, assisted)")
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_name,
+            torch_dtype=dtype,
+            low_cpu_mem_usage=True
+        ).to(device)
+        model.eval()
+        processor = AutoProcessor.from_pretrained(model_name)
+        _SEQ2SEQ_CACHE[key] = (model, processor)
+    return _SEQ2SEQ_CACHE[key]
+
+
+# 16kHz mono 파형 로드
+def _load_audio_16k(audio_path: str):
+    speech, sampling_rate = torchaudio.load(audio_path)
+    speech = speech.mean(dim=0)
+    if sampling_rate != 16000:
+        speech = torchaudio.functional.resample(speech, orig_freq=sampling_rate, new_freq=16000)
+    return speech.numpy()
+
+
+# assisted generation 중 target 모델이 검증한 횟수와 확정된 토큰 수를 집계 (target 토크나이저 기준)
+class _AssistedStats(BaseStreamer):
+    def __init__(self):
+        self.prompt_seen = False
+        self.new_tokens = 0
+        self.target_steps = 0
+
+    def put(self, value):
+        # 첫 호출은 decoder prompt 토큰
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        self.new_tokens += value.numel()
+        self.target_steps += 1
+
+    def end(self):
+        # long-form 디코딩은 30초 구간마다 generate를 다시 호출하므로 다음 호출의 prompt를 다시 건너뜀
+        self.prompt_seen = False
+
+
+# 작은 모델(assistant)이 토큰을 초안으로 만들고 큰 모델이 검증하는 speculative decoding
+def transcribe_audio_assisted(audio_path: str,
+                              model_name: str,
+                              assistant_name: str,
+                              whisper_cfg: dict = None,
+                              use_assistant: bool = True):
+    whisper_cfg = whisper_cfg or {}
+    assisted_cfg = whisper_cfg.get("assisted", {})
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if device == "cuda" else torch.float32
+
+    model, processor = _load_seq2seq(model_name, device, dtype)
+    assistant, assistant_processor = _load_seq2seq(assistant_name, device, dtype)
+    num_assistant_tokens = assisted_cfg.get("num_assistant_tokens", 5)
+    assistant.generation_config.num_assistant_tokens = num_assistant_tokens
+    # 검증 1회마다 초안 토큰 수를 고정하여 채택률의 분모를 알 수 있도록 함
+    assistant.generation_config.num_assistant_tokens_schedule = "constant"
+
+    # long-form 디코딩은 구간마다 assistant encoder가 target과 같은 입력 특징을 받아야 함
+    # (large-v3/distil-large-v3: 128 mel, medium: 80 mel)
+    if use_assistant and model.config.num_mel_bins != assistant.config.num_mel_bins:
+        raise ValueError(f"assistant 모델의 mel bin 수가 다릅니다: {model_name}({model.config.num_mel_bins}) / "
+                         f"{assistant_name}({assistant.config.num_mel_bins}). "
+                         f"같은 입력 특징을 쓰는 assistant(예: {DEFAULT_ASSISTANT_MODEL})를 지정하세요.")
+    # vocab이 다르면 토크나이저를 함께 넘겨 universal assisted decoding 사용
+    same_vocab = model.config.vocab_size == assistant.config.vocab_size
+
+    generate_kwargs = {"task": "transcribe"}
+    if assisted_cfg.get("language"):
+        generate_kwargs["language"] = assisted_cfg["language"]
+    if use_assistant:
+        generate_kwargs["assistant_model"] = assistant
+        if not same_vocab:
+            generate_kwargs.update(tokenizer=processor.tokenizer,
+                                   assistant_tokenizer=assistant_processor.tokenizer)
+
+    # 30초를 넘는 음성은 잘라내지 않고 전체 특징을 넘겨 Whisper long-form(구간 이동) 디코딩 사용
+    speech = _load_audio_16k(audio_path)
+    inputs = processor(speech, sampling_rate=16000, return_tensors="pt", truncation=False,
+                       padding="longest", return_attention_mask=True)
+    if inputs.input_features.shape[-1] < 3000:
+        # 30초 이하면 기존처럼 30초 길이로 padding한 short-form 입력
+        inputs = processor(speech, sampling_rate=16000, return_tensors="pt", return_attention_mask=True)
+
+    stats = _AssistedStats()
+    start = time.perf_counter()
+    with torch.no_grad():
+        predicted_ids = model.generate(inputs.input_features.to(device, dtype),
+                                       attention_mask=inputs.attention_mask.to(device),
+                                       streamer=stats, **generate_kwargs)
+    decode_time = time.perf_counter() - start
+    text = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0].strip()
+    new_tokens, target_steps = stats.new_tokens, stats.target_steps
+
+    # target 한 번의 검증마다 (채택된 초안 토큰 + target 토큰 1개)가 확정됨
+    accepted_tokens = max(new_tokens - target_steps, 0) if use_assistant else 0
+    # 초안은 검증 1회마다 num_assistant_tokens개 (EOS/최대 길이에서 줄어들 수 있으므로 상한)
+    # vocab이 다르면 초안이 assistant 토큰 단위라 target 토큰 기준 채택 수와 비교할 수 없으므로 채택률을 계산하지 않음
+    draft_tokens = num_assistant_tokens * target_steps if use_assistant and same_vocab else None
+    stats = {
+        "model": model_name,
+        "assistant": assistant_name if use_assistant else None,
+        "decode_time": decode_time,
+        "new_tokens": new_tokens,
+        "target_steps": target_steps,
+        "tokens_per_step": new_tokens / target_steps if target_steps else 0.0,
+        "draft_tokens": draft_tokens,
+        "accepted_tokens": accepted_tokens,
+        "acceptance_rate": accepted_tokens / draft_tokens if draft_tokens else None,
+    }
+    if use_assistant:
+        rate = (f"acceptance rate {stats['acceptance_rate']:.2%} ({accepted_tokens}/{draft_tokens})"
+                if stats["acceptance_rate"] is not None else "acceptance rate n/a (vocab 다름)")
+        print(f"[INFO] assisted decoding: {decode_time:.1f}s, "
+              f"{stats['tokens_per_step']:.2f} tokens/step, {rate}")
+    return text, stats
+
+
+# assisted 모드와 단독 모드의 디코딩 시간 비교
+def benchmark_whisper_assisted(audio_path: str, whisper_cfg: dict = None) -> dict:
+    assisted_cfg = (whisper_cfg or {}).get("assisted", {})
+    model_name = assisted_cfg.get("model", DEFAULT_ASSISTED_MODEL)
+    assistant_name = assisted_cfg.get("assistant", DEFAULT_ASSISTANT_MODEL)
+    try:
+        _, baseline = transcribe_audio_assisted(audio_path, model_name, assistant_name, whisper_cfg,
+                                                use_assistant=False)
+        _, assisted = transcribe_audio_assisted(audio_path, model_name, assistant_name, whisper_cfg)
+    finally:
+        release_seq2seq_models()
+    result = {
+        "baseline": baseline,
+        "assisted": assisted,
+        "speedup": baseline["decode_time"] / assisted["decode_time"],
+    }
+    print(f"[BENCH] {model_name} + {assistant_name}: speedup {result['speedup']:.2f}x, "
+          f"{assisted['tokens_per_step']:.2f} tokens/step")
+    return result
+
+# 음성 파일 내용 해시 (같은 녹음이면 경로/스토리가 달라도 같은 값)
+def hash_audio_file(audio_path: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# 전사 결과에 영향을 주는 디코딩 옵션만 추림
+# 실제로 전사에 쓰이는 경로(assisted / cpu 엔진 / transformers pipeline)의 엔진, 장치, dtype을 기록
+def _decoding_options(model_name: str, whisper_cfg: dict) -> dict:
+    assisted_cfg = whisper_cfg.get("assisted", {})
+    cuda = torch.cuda.is_available()
+    if assisted_cfg.get("enabled", False) and model_name == assisted_cfg.get("model", DEFAULT_ASSISTED_MODEL):
+        # transcribe_audio_assisted와 같은 장치/dtype
+        return {
+            "engine": "assisted",
+            "device": "cuda" if cuda else "cpu",
+            "dtype": "float16" if cuda else "float32",
+            "assistant": assisted_cfg.get("assistant", DEFAULT_ASSISTANT_MODEL),
+            "language": assisted_cfg.get("language"),
+        }
+    engine = _resolve_engine(whisper_cfg)
+    if engine == "cpu":
+        # _load_cpu_whisper_pipe와 같은 구성
+        onnx = whisper_cfg.get("onnx", False)
+        quantize = whisper_cfg.get("quantize", "int8")
+        return {
+            "engine": "onnx" if onnx else "cpu",
+            "device": "cpu",
+            "dtype": "int8" if quantize == "int8" else "float32",
+        }
+    # load_whisper_pipe의 transformers pipeline (기본 dtype float32)
+    return {
+        "engine": engine,
+        "device": "cuda" if cuda else "cpu",
+        "dtype": "float32",
+    }
+
+
+# 음성 내용 해시 + 모델 + 디코딩 옵션을 키로 하는 전사 캐시 (스토리 디렉토리 밖에 저장)
+class TranscriptCache:
+    def __init__(self, cache_dir: str = "./cache/transcripts") -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, audio_hash: str, model_name: str, options: dict) -> str:
+        payload = json.dumps({"audio": audio_hash, "model": model_name, "options": options},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        path = self.cache_dir / f"{key}.json"
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["text"]
+
+    def put(self, key: str, text: str, **metadata):
+        # 임시 파일에 쓴 뒤 교체하여 동시 실행 시 깨진 파일이 남지 않도록 함
+        path = self.cache_dir / f"{key}.json"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"text": text, **metadata}, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
 # 여러가지 whisper 모델 사용 가능
 # WHISPER_MODELS = [
 #     "seastar105/whisper-medium-ko-zeroth", 
@@ -67,10 +424,43 @@ def inject_whisper_text_to_config(config, whisper_text: str):
     print("[INFO] Whisper 텍스트가 story_writer.params.full_context에 삽입되었습니다.")
 
 
-def transcribe_and_save_all_models(audio_path: str, story_dir: str) -> list:
+def transcribe_and_save_all_models(audio_path: str, story_dir: str, whisper_cfg: dict = None) -> list:
+    whisper_cfg = whisper_cfg or {}
+    assisted_cfg = whisper_cfg.get("assisted", {})
+    cache_cfg = whisper_cfg.get("cache", {})
+    cache = TranscriptCache(cache_cfg.get("dir", "./cache/transcripts")) if cache_cfg.get("enabled", True) else None
+    audio_hash = hash_audio_file(audio_path) if cache is not None else None
+
     all_texts = []
     for i, model_name in enumerate(WHISPER_MODELS, start=1):
-        text = transcribe_audio(audio_path, model_name)
+        cache_key = None
+        text = None
+        if cache is not None:
+            options = _decoding_options(model_name, whisper_cfg)
+            cache_key = cache.key(audio_hash, model_name, options)
+            text = cache.get(cache_key)
+            if text is not None:
+                print(f"[INFO] 캐시된 전사 결과 사용 (모델: {model_name})")
+
+        if text is None:
+            if assisted_cfg.get("enabled", False) and model_name == assisted_cfg.get("model", DEFAULT_ASSISTED_MODEL):
+                try:
+                    text, stats = transcribe_audio_assisted(
+                        audio_path,
+                        model_name,
+                        assisted_cfg.get("assistant", DEFAULT_ASSISTANT_MODEL),
+                        whisper_cfg
+                    )
+                finally:
+                    # target/assistant 모델은 이 전사에서만 사용하므로 바로 해제
+                    release_seq2seq_models()
+                with open(os.path.join(story_dir, "whisper_assisted_stats.json"), "w", encoding="utf-8") as f:
+                    json.dump(stats, f, indent=4, ensure_ascii=False)
+            else:
+                text = transcribe_audio(audio_path, model_name, whisper_cfg)
+            if cache is not None:
+                cache.put(cache_key, text, audio_sha256=audio_hash, model=model_name, options=options)
+
         all_texts.append(text)
         file_path = os.path.join(story_dir, f"full_text_raw{i}.txt")
         with open(file_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,57 @@
+# GPU 없는 배치 워커에서 모델을 돌리기 위한 공용 CPU 유틸리티
+import os
+
+import torch
+
+
+# 물리 코어 수 (SMT 논리 CPU를 제외, psutil이 없으면 /proc/cpuinfo, 둘 다 안 되면 논리 CPU 수)
+def physical_cpu_count() -> int:
+    try:
+        import psutil
+
+        count = psutil.cpu_count(logical=False)
+        if count:
+            return count
+    except ImportError:
+        pass
+    try:
+        cores = set()
+        physical_id = core_id = None
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    core_id = value.strip()
+                elif not key and core_id is not None:
+                    cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+        if core_id is not None:
+            cores.add((physical_id, core_id))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+# 연산 스레드 수 설정 (None이면 물리 코어 수 기준)
+def configure_cpu_threads(num_threads: int = None, num_interop_threads: int = None):
+    if num_threads is None:
+        num_threads = physical_cpu_count()
+    torch.set_num_threads(num_threads)
+    # interop 스레드는 프로세스당 한 번만 설정 가능하므로 실패해도 무시
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            pass
+    return num_threads
+
+
+# nn.Linear 레이어를 int8 dynamic quantization으로 변환
+def quantize_linear_int8(model: torch.nn.Module) -> torch.nn.Module:
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
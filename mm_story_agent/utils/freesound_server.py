@@ -0,0 +1,219 @@
+# Freesound API 로컬 대역 서버
+# search_download_sound / FreesoundClient가 사용하는 엔드포인트만 구현하며, 미리듣기는 fixture 디렉토리의 파일을 그대로 제공
+#   GET /apiv2/search/text/?query=...&filter=duration:[0 TO x]
+#   GET /apiv2/sounds/{id}/
+#   GET /apiv2/previews/{id}.{ext}
+# 응답 지연(latency, jitter)과 오류 주입(503, 429 + Retry-After)을 설정할 수 있어 재시도/동시성/캐시를 결정적으로 측정 가능
+#
+# 실행 예) python -m mm_story_agent.utils.freesound_server --fixtures assets/freesound --port 8765 --latency 0.2
+#          FREESOUND_API_BASE=http://127.0.0.1:8765/apiv2 python run.py -c configs/mm_story_agent.yaml
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import soundfile as sf
+
+AUDIO_SUFFIXES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".ogg": "audio/ogg", ".flac": "audio/flac"}
+
+
+# fixture 디렉토리의 오디오 파일 목록 → 소리 카탈로그 (정렬 순서대로 id 1부터 부여)
+def load_catalogue(fixture_dir) -> List[Dict]:
+    catalogue = []
+    files = sorted(path for path in Path(fixture_dir).iterdir() if path.suffix.lower() in AUDIO_SUFFIXES)
+    for sound_id, path in enumerate(files, start=1):
+        try:
+            duration = sf.info(str(path)).duration
+        except RuntimeError:
+            duration = 0.0
+        catalogue.append({
+            "id": sound_id,
+            "name": path.stem,
+            "tokens": set(re.findall(r"\w+", path.stem.lower())),
+            "duration": duration,
+            "path": path,
+        })
+    return catalogue
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FreesoundStubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        stub = self.server
+        endpoint = url.path.rstrip("/").split("/")[2] if url.path.count("/") >= 2 else url.path
+        stub.count(endpoint)
+
+        delay, error = stub.draw()
+        if delay > 0:
+            time.sleep(delay)
+        if error == 429:
+            return self._send_json(429, {"detail": "Request was throttled."},
+                                   headers={"Retry-After": str(stub.retry_after)})
+        if error == 503:
+            return self._send_json(503, {"detail": "Service temporarily unavailable."})
+
+        match = re.fullmatch(r"/apiv2/search/text/?", url.path)
+        if match:
+            params = parse_qs(url.query)
+            return self._send_json(200, stub.search(params.get("query", [""])[0], params.get("filter", [""])[0]))
+
+        match = re.fullmatch(r"/apiv2/sounds/(\d+)/?", url.path)
+        if match:
+            sound = stub.sound(int(match.group(1)))
+            if sound is None:
+                return self._send_json(404, {"detail": "Not found."})
+            return self._send_json(200, sound)
+
+        match = re.fullmatch(r"/apiv2/previews/(\d+)\.\w+", url.path)
+        if match:
+            sound = stub.catalogue_by_id.get(int(match.group(1)))
+            if sound is None:
+                return self._send_json(404, {"detail": "Not found."})
+            return self._send(200, sound["path"].read_bytes(), AUDIO_SUFFIXES[sound["path"].suffix.lower()])
+
+        return self._send_json(404, {"detail": "Not found."})
+
+
+class FreesoundStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self,
+                 fixture_dir,
+                 host: str = "127.0.0.1",
+                 port: int = 0,                 # 0이면 빈 포트 자동 선택
+                 latency: float = 0.0,          # 모든 응답의 기본 지연 (초)
+                 latency_jitter: float = 0.0,   # 0 ~ jitter 사이의 추가 지연 (초)
+                 error_rate: float = 0.0,       # 503 응답 확률
+                 rate_limit_rate: float = 0.0,  # 429 응답 확률
+                 retry_after: int = 1,          # 429 응답의 Retry-After (초)
+                 seed: int = 0) -> None:
+        super().__init__((host, port), _Handler)
+        self.catalogue = load_catalogue(fixture_dir)
+        if not self.catalogue:
+            raise ValueError(f"fixture 디렉토리에 오디오 파일이 없습니다: {fixture_dir}")
+        self.catalogue_by_id = {sound["id"]: sound for sound in self.catalogue}
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self._thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/apiv2"
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    # 이번 요청의 지연과 주입할 오류 (seed가 같으면 요청 순서에 따라 같은 결과)
+    def draw(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.latency_jitter)
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+    # 검색어 단어와 파일 이름 단어가 많이 겹치는 순으로 정렬 (겹치는 소리가 없으면 검색어 해시로 하나 선택)
+    def search(self, query: str, duration_filter: str = "") -> Dict:
+        max_duration = float("inf")
+        match = re.search(r"duration:\[\s*[\d.]+\s+TO\s+([\d.]+)\s*\]", duration_filter)
+        if match:
+            max_duration = float(match.group(1))
+        candidates = [sound for sound in self.catalogue if sound["duration"] <= max_duration]
+        tokens = set(re.findall(r"\w+", query.lower()))
+        scored = sorted(((len(tokens & sound["tokens"]), sound) for sound in candidates),
+                        key=lambda item: (-item[0], item[1]["id"]))
+        results = [sound for score, sound in scored if score > 0]
+        if not results and candidates:
+            results = [candidates[sum(query.encode("utf-8")) % len(candidates)]]
+        return {
+            "count": len(results),
+            "results": [{"id": sound["id"], "name": sound["name"]} for sound in results[:15]],
+        }
+
+    def sound(self, sound_id: int):
+        sound = self.catalogue_by_id.get(sound_id)
+        if sound is None:
+            return None
+        preview_url = f"{self.api_base}/previews/{sound_id}{sound['path'].suffix.lower()}"
+        return {
+            "id": sound_id,
+            "name": sound["name"],
+            "duration": sound["duration"],
+            "previews": {
+                "preview-hq-mp3": preview_url,
+                "preview-lq-mp3": preview_url,
+            },
+        }
+
+    # 백그라운드 스레드에서 서비스 시작
+    def start(self) -> "FreesoundStubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", type=str, required=True, help="미리듣기로 제공할 오디오 파일 디렉토리")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="응답 지연 (초)")
+    parser.add_argument("--latency_jitter", type=float, default=0.0, help="추가 무작위 지연 최대값 (초)")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="503 응답 확률")
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="429 응답 확률")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FreesoundStubServer(args.fixtures, args.host, args.port, args.latency, args.latency_jitter,
+                                 args.error_rate, args.rate_limit_rate, seed=args.seed)
+    print(f"[INFO] Freesound 대역 서버: {server.api_base} (소리 {len(server.catalogue)}개)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -2,11 +2,13 @@ from pathlib import Path
 from typing import List, Union
 import random
 import re
+import json
 from datetime import timedelta
 
 from tqdm import trange
 import numpy as np
 import librosa
+import soundfile as sf
 import cv2
 from zhon.hanzi import punctuation as zh_punc
 from moviepy.editor import ImageClip, AudioFileClip, CompositeAudioClip, \
@@ -32,10 +34,38 @@ from typing import List, Union
 from pathlib import Path
 from datetime import timedelta
 
+def _chunk_times_from_words(chunks: List[str], words: List, start_time: float, end_time: float) -> List:
+    """
+    TTS 단어 경계를 이용해 자막 줄별 (시작, 종료) 시간을 계산하는 함수
+    각 줄의 글자 수(문장부호/공백 제외)만큼 단어를 순서대로 배정하고, 줄의 시작은 첫 단어의 시작 시간으로 둔다.
+    """
+    def num_chars(text):
+        return sum(ch.isalnum() for ch in text)
+
+    chunk_starts = []
+    word_idx = 0
+    for chunk in chunks:
+        chunk_starts.append(words[word_idx]["start"] if word_idx < len(words) else None)
+        remaining = num_chars(chunk)
+        while word_idx < len(words) and remaining > 0:
+            remaining -= num_chars(words[word_idx]["text"])
+            word_idx += 1
+
+    chunk_starts[0] = start_time
+    chunk_times = []
+    for chunk_idx in range(len(chunks)):
+        chunk_start = chunk_starts[chunk_idx] if chunk_starts[chunk_idx] is not None else chunk_times[-1][1]
+        next_starts = [t for t in chunk_starts[chunk_idx + 1:] if t is not None]
+        chunk_end = next_starts[0] if next_starts else end_time
+        chunk_times.append((chunk_start, max(chunk_end, chunk_start)))
+    return chunk_times
+
+
 def generate_srt(timestamps: List,
                  captions: List,
                  save_path: Union[str, Path],
-                 max_single_length: int = 30):
+                 max_single_length: int = 30,
+                 word_timings: List = None):
     """
     자막의 시작/종료 시간과 텍스트를 기반으로 SRT 파일을 생성하는 함수
 
@@ -44,6 +74,7 @@ def generate_srt(timestamps: List,
     - captions (List[str]): 각 자막에 대응하는 문자열 리스트
     - save_path (str or Path): 생성된 .srt 파일을 저장할 경로
     - max_single_length (int): 한 자막 줄의 최대 문자 수 (기본값: 30)
+    - word_timings (List[List[dict]] or None): 각 자막의 단어 경계 (절대 시간). 있으면 줄 시간을 단어 경계에 맞춤
     """
 
     # 초 단위 시간을 SRT 형식의 시:분:초,밀리초 문자열로 변환하는 내부 함수
@@ -67,13 +98,20 @@ def generate_srt(timestamps: List,
         if num_chunks == 0:
             continue  # 빈 자막은 건너뜀
 
-        # 각 줄마다 배정될 자막 구간 시간 (자막 전체 시간 / 줄 수)
-        segment_duration = (end_time - start_time) / num_chunks
+        words = word_timings[idx] if word_timings is not None else None
+        if words:
+            # 단어 경계가 있으면 실제 발화 시간에 맞춰 줄 시간 배정
+            chunk_times = _chunk_times_from_words(caption_chunks, words, start_time, end_time)
+        else:
+            # 각 줄마다 배정될 자막 구간 시간 (자막 전체 시간 / 줄 수)
+            segment_duration = (end_time - start_time) / num_chunks
+            chunk_times = [(start_time + segment_duration * chunk_idx,
+                            start_time + segment_duration * (chunk_idx + 1))
+                           for chunk_idx in range(num_chunks)]
 
         for chunk_idx, chunk in enumerate(caption_chunks):
-            # 각 자막 줄의 시작/종료 시간 계산
-            chunk_start_time = start_time + segment_duration * chunk_idx
-            chunk_end_time = start_time + segment_duration * (chunk_idx + 1)
+            # 각 자막 줄의 시작/종료 시간
+            chunk_start_time, chunk_end_time = chunk_times[chunk_idx]
 
             # SRT 포맷 시간 문자열로 변환
             start_time_str = format_time(chunk_start_time)
@@ -97,9 +135,10 @@ def add_caption(captions: List,  # 자막 텍스트 리스트
                 timestamps: List,  # 자막의 시작/종료 시간 리스트 (초 단위)
                 video_clip: VideoClip,  # 자막을 입힐 원본 영상 클립
                 max_single_length: int = 30,  # 자막 한 줄당 최대 글자 수
+                word_timings: List = None,  # 자막별 단어 경계 (없으면 글자 수 기준 균등 분할)
                 **caption_config):  # TextClip에 들어갈 설정 (폰트, 색상 등)
     
-    generate_srt(timestamps, captions, srt_path, max_single_length)  # SRT 자막 파일 생성
+    generate_srt(timestamps, captions, srt_path, max_single_length, word_timings)  # SRT 자막 파일 생성
 
     generator = lambda txt: TextClip(txt, **caption_config)  # 자막 텍스트로 TextClip 생성하는 함수 정의
     subtitles = SubtitlesClip(srt_path.__str__(), generator)  # SRT 파일을 읽어 SubtitlesClip 생성
@@ -287,6 +326,16 @@ def add_slide_effect(clips, slide_duration):  # 여러 클립에 슬라이드 
     return video  # 최종 영상 반환
 
 
+# 음성 에이전트가 이미 설정 샘플레이트의 PCM WAV로 저장했다면 디코딩/리샘플링 없이 바로 클립 생성
+def load_speech_clip(speech_file: Union[str, Path], audio_sample_rate: int, speech_timing: dict = None):
+    if speech_timing is not None and speech_timing.get("sample_rate") == audio_sample_rate:
+        speech_array, _ = sf.read(str(speech_file), dtype="float32", always_2d=True)
+        if speech_array.shape[1] == 1:
+            speech_array = np.repeat(speech_array, 2, axis=1)  # 무음 클립과 같은 2채널로 맞춤
+        return AudioArrayClip(speech_array, fps=audio_sample_rate)
+    return AudioFileClip(str(speech_file), fps=audio_sample_rate)
+
+
 def compose_video(story_dir: Union[str, Path],  # 스토리 디렉토리 경로
                   save_path: Union[str, Path],  # 저장할 최종 영상 파일 경로
                   captions: List,  # 각 페이지 자막 리스트
@@ -314,40 +363,68 @@ def compose_video(story_dir: Union[str, Path],  # 스토리 디렉토리 경로
     video_clips = []  # 최종 영상 클립 리스트
     cur_duration = 0  # 현재까지의 누적 시간
     timestamps = []  # 자막 타임스탬프 리스트
+    caption_texts = []  # timestamps와 짝을 이루는 자막 텍스트
+    caption_words = []  # 자막별 단어 경계 (절대 시간, 없으면 None)
 
     for page in trange(1, num_pages + 1):  # 각 페이지 반복
         # 슬라이드/페이드 구간 무음 처리용 클립 생성
         slide_silence = AudioArrayClip(np.zeros((int(audio_sample_rate * slide_duration), 2)), fps=audio_sample_rate)
         fade_silence = AudioArrayClip(np.zeros((int(audio_sample_rate * fade_duration), 2)), fps=audio_sample_rate)
 
+        # 음성 에이전트가 남긴 타이밍 사이드카 (발화 텍스트, 길이, 단어 경계)
+        timing_file = speech_dir / f"p{page}.json"
+        speech_timing = None
+        if timing_file.exists():
+            with open(timing_file, encoding="utf-8") as f:
+                speech_timing = json.load(f)
+
         if (speech_dir / f"p{page}.wav").exists():  # 단일 음성 파일 존재 시
             single_utterance = True
             speech_file = str(speech_dir / f"./p{page}.wav")
-            speech_clip = AudioFileClip(speech_file, fps=audio_sample_rate)
+            speech_clip = load_speech_clip(speech_file, audio_sample_rate, speech_timing)
             speech_clip = concatenate_audioclips([fade_silence, speech_clip, fade_silence])
         else:  # 복수 음성 파일인 경우
             single_utterance = False
             speech_files = sorted(speech_dir.glob(f"p{page}_*.wav"), key=lambda x: int(x.stem.split("_")[-1]))
             speech_clips = []
+            utterance_spans = []
 
             for utt_idx, speech_file in enumerate(speech_files):
-                speech_clip = AudioFileClip(str(speech_file), fps=audio_sample_rate)
+                speech_clip = load_speech_clip(speech_file, audio_sample_rate, speech_timing)
 
                 if utt_idx == 0:
-                    timestamps.append([cur_duration + fade_duration,
-                                       cur_duration + fade_duration + speech_clip.duration])
+                    utterance_spans.append([cur_duration + fade_duration,
+                                            cur_duration + fade_duration + speech_clip.duration])
                     cur_duration += speech_clip.duration + fade_duration
                 elif utt_idx == len(speech_files) - 1:
-                    timestamps.append([cur_duration,
-                                       cur_duration + speech_clip.duration])
+                    utterance_spans.append([cur_duration,
+                                            cur_duration + speech_clip.duration])
                     cur_duration += speech_clip.duration + fade_duration + slide_duration
                 else:
-                    timestamps.append([cur_duration,
-                                       cur_duration + speech_clip.duration])
+                    utterance_spans.append([cur_duration,
+                                            cur_duration + speech_clip.duration])
                     cur_duration += speech_clip.duration
 
                 speech_clips.append(speech_clip)
 
+            if len(speech_files) == 1:  # 발화가 하나면 마지막 발화 처리도 함께 적용
+                cur_duration += slide_duration + fade_duration
+
+            utterances = speech_timing["utterances"] if speech_timing is not None else []
+            if len(utterances) == len(speech_files):
+                # 발화(문장)마다 자막을 두고, 단어 경계를 절대 시간으로 변환
+                for span, utterance in zip(utterance_spans, utterances):
+                    timestamps.append(span)
+                    caption_texts.append(utterance["text"])
+                    caption_words.append([{"text": word["text"],
+                                           "start": span[0] + word["start"],
+                                           "end": span[0] + word["end"]} for word in utterance["words"]])
+            else:
+                # 발화별 텍스트가 없으면 페이지 자막을 페이지 전체 발화 구간에 배치
+                timestamps.append([utterance_spans[0][0], utterance_spans[-1][1]])
+                caption_texts.append(captions[page - 1])
+                caption_words.append(None)
+
             speech_clip = concatenate_audioclips([fade_silence] + speech_clips + [fade_silence])
             speech_file = speech_files[0]
 
@@ -365,10 +442,22 @@ def compose_video(story_dir: Union[str, Path],  # 스토리 디렉토리 경로
                 timestamps.append([cur_duration + fade_duration + slide_duration,
                                    cur_duration + speech_clip.duration - fade_duration - slide_duration])
                 cur_duration += speech_clip.duration - slide_duration
+            caption_texts.append(captions[page - 1])
+            if speech_timing is not None and len(speech_timing["utterances"]) == 1:
+                utterance_start = timestamps[-1][0]
+                caption_words.append([{"text": word["text"],
+                                       "start": utterance_start + word["start"],
+                                       "end": utterance_start + word["end"]}
+                                      for word in speech_timing["utterances"][0]["words"]])
+            else:
+                caption_words.append(None)
 
-        # 음성 에너지 계산 (배경음 대비 비율 조정용)
-        speech_array, _ = librosa.core.load(speech_file, sr=None)
-        speech_rms = librosa.feature.rms(y=speech_array)[0].mean()
+        # 음성 에너지 계산 (배경음 대비 비율 조정용, 사이드카에 있으면 다시 디코딩하지 않음)
+        if speech_timing is not None and speech_timing["utterances"] and "rms" in speech_timing["utterances"][0]:
+            speech_rms = speech_timing["utterances"][0]["rms"]
+        else:
+            speech_array, _ = librosa.core.load(speech_file, sr=None)
+            speech_rms = librosa.feature.rms(y=speech_array)[0].mean()
 
         # 이미지 클립 설정
         image_file = str(image_dir / f"./p{page}.png")
@@ -409,11 +498,12 @@ def compose_video(story_dir: Union[str, Path],  # 스토리 디렉토리 경로
     max_caption_length = caption_config["max_length"]
     del caption_config["max_length"]
     composite_clip = add_caption(
-        captions,
+        caption_texts,
         story_dir / "captions.srt",
         timestamps,
         composite_clip,
         max_caption_length,
+        word_timings=caption_words,
         **caption_config
     )
 
@@ -1,6 +1,7 @@
 import argparse # config 파일을 받을 수 있도록 해줌
 import yaml # yaml(설정파일)을 읽고 딕셔너리로 파싱
 import os
+import sys
 from mm_story_agent import MMStoryAgent # 멀티 모달 스토리 에이전트 핵심 클래스
 from mm_story_agent.modality_agents import story_agent  # 여러 Agent가 포함된 모듈
 from mm_story_agent.modality_agents.whisper_utils import (
@@ -20,6 +21,7 @@ from mm_story_agent.modality_agents.LLMexaone import ExaoneAgent
 
 ### 코드 실행 명령어
 # python run.py -c configs/mm_story_agent.yaml -a data/이상윤.mp3
+# 이미지 일부 페이지만 다시 생성: python run.py -c configs/mm_story_agent.yaml --rerender 3,5
 
 
 if __name__ == "__main__":
@@ -27,6 +29,10 @@ if __name__ == "__main__":
     # 인자들을 통해 YAML 설정 파일 경로와 음성파일 경로 받기
     parser.add_argument("--config", "-c", type=str, required=True, help="YAML 설정 파일 경로")
     parser.add_argument("--audio", "-a", type=str, required=False, help="Whisper용 음성 파일 경로")
+    parser.add_argument("--assisted", action="store_true", help="Whisper speculative decoding(assisted generation) 사용")
+    parser.add_argument("--stream", action="store_true", help="실시간 스트리밍 인식 (-a에 자라나는 파일 경로 또는 stdin은 '-')")
+    parser.add_argument("--rerender", type=str, required=False,
+                        help="저장된 image_prompts.json으로 다시 생성할 이미지 페이지 번호 (1부터, 예: 3,5)")
     args = parser.parse_args()
 
     # YAML 설정 파일 불러오기
@@ -36,10 +42,50 @@ if __name__ == "__main__":
     # story 디렉토리 생성
     story_dir = config.get("video_compose", {}).get("params", {}).get("story_dir", "generated_stories/example")
     os.makedirs(story_dir, exist_ok=True)
+
+    # 이미지 재생성: 이전 실행의 프롬프트/설정으로 지정한 페이지만 다시 그리고 종료 (Whisper, LLM 호출 없음)
+    if args.rerender:
+        from mm_story_agent.modality_agents.image_agent import StoryDiffusionAgent
+
+        page_numbers = [int(page) for page in args.rerender.split(",") if page.strip()]
+        image_dir = Path(config.get("story_dir") or story_dir) / "image"
+        StoryDiffusionAgent(config["image_generation"]["cfg"]).rerender({
+            "save_path": image_dir,
+            "page_numbers": page_numbers,
+        })
+        print(f"[INFO] 이미지 재생성 완료: {image_dir} (페이지 {page_numbers})")
+        sys.exit(0)
+
+    stream_segments = None
+    # 스트리밍 인식: 확정된 구간을 파이프라인이 소비하는 대로 전사 (16kHz mono PCM/WAV 입력)
+    if args.stream:
+        if not args.audio:
+            raise ValueError("--stream 사용 시 -a로 입력 파일 경로 또는 '-'(stdin)를 지정해야 합니다.")
+        from mm_story_agent.modality_agents.whisper_utils import WHISPER_MODELS
+        from mm_story_agent.modality_agents.streaming_whisper import StreamingTranscriber, read_pcm_chunks
+
+        whisper_cfg = config.get("whisper", {}).get("cfg", {})
+        stream_cfg = whisper_cfg.get("stream", {})
+        transcriber = StreamingTranscriber(
+            stream_cfg.get("model", WHISPER_MODELS[0]),
+            whisper_cfg,
+            step_s=stream_cfg.get("step_s", 2.0),
+            max_buffer_s=stream_cfg.get("max_buffer_s", 30.0),
+            stability_margin_s=stream_cfg.get("stability_margin_s", 1.0)
+        )
+        stream_segments = transcriber.stream(read_pcm_chunks(
+            args.audio,
+            chunk_s=stream_cfg.get("chunk_s", 0.5),
+            idle_timeout=stream_cfg.get("idle_timeout", 3.0)
+        ))
+
     # Whisper 음성 인식 수행
-    if args.audio:
+    elif args.audio:
         print(f"[INFO] Whisper 다중 모델 음성 인식 수행 중... ({args.audio})")
-        whisper_texts = transcribe_and_save_all_models(args.audio, story_dir)
+        whisper_cfg = config.get("whisper", {}).get("cfg", {})
+        if args.assisted:
+            whisper_cfg.setdefault("assisted", {})["enabled"] = True
+        whisper_texts = transcribe_and_save_all_models(args.audio, story_dir, whisper_cfg)
 
         # LLM Agent 생성
         llm_agent = ExaoneAgent(config)
@@ -88,4 +134,7 @@ if __name__ == "__main__":
 
     # 전체 스토리 생성 파이프라인 실행
     mm_story_agent = MMStoryAgent()
-    mm_story_agent.call(config)
\ No newline at end of file
+    if stream_segments is not None:
+        mm_story_agent.call_stream(config, stream_segments)
+    else:
+        mm_story_agent.call(config)
\ No newline at end of file